@@ -0,0 +1,138 @@
+### Plays maps headless on every core and writes one JSON line of stats per run
+# python batch.py                                  -> every shipped map once, canned input
+# python batch.py data/maps --runs 100 --input random --out runs.jsonl
+# python batch.py test0.json --runs 1000 --workers 32 --frames 3600
+# NOTE every worker process builds one headless Game (window, assets, sounds) and reuses it for all its runs
+# NOTE outcomes: completed (every enemy dead), died, timeout (--frames ran out), no_enemies (map has no enemy spawners, nothing to beat, not played)
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1') # stdout is for the JSON lines
+import pygame
+
+MAPS = ['map.json', 'map0.json', 'map1.json', 'test.json', 'test0.json', 'test1.json', 'test2.json', 'test3.json']
+INPUTS = ['canned', 'random', 'none']
+
+game = None # the worker's Game (see init_worker)
+
+def init_worker():
+    global game
+    sys.stdout = sys.stderr # the Game prints things, stdout is for the JSON lines
+    from game import Game # imported here so the parent process never opens a window
+    game = Game(headless=True, seed=0)
+
+def random_input(frames, seed):
+    # random but reproducible button mashing: hold a direction for a while, jump/dash every now and then
+    rng = random.Random(seed)
+    inputs = []
+    held = None
+    for frame in range(frames):
+        events = []
+        if rng.random() < 0.02:
+            if held:
+                events.append(pygame.event.Event(pygame.KEYUP, key=held))
+            held = rng.choice([pygame.K_LEFT, pygame.K_RIGHT, None])
+            if held:
+                events.append(pygame.event.Event(pygame.KEYDOWN, key=held))
+        if rng.random() < 0.03:
+            events.append(pygame.event.Event(pygame.KEYDOWN, key=pygame.K_UP))
+        if rng.random() < 0.01:
+            events.append(pygame.event.Event(pygame.KEYDOWN, key=pygame.K_x))
+        inputs.append(events)
+    return inputs
+
+def make_input(kind, frames, seed):
+    if kind == 'canned':
+        from benchmark import canned_input
+        return canned_input(frames)
+    if kind == 'random':
+        return random_input(frames, seed)
+    return []
+
+def play(task):
+    # runs one playthrough in the worker, stops early once the level is beaten or the player dies
+    map_path, seed, frames, input_kind = task
+    start = time.perf_counter()
+    game.new_run(map_path, seed=seed)
+    load_time = time.perf_counter() - start
+
+    enemies = len(game.enemies)
+    result = {'map': map_path, 'seed': seed, 'input': input_kind, 'enemies': enemies, 'outcome': 'timeout', 'frames': frames}
+    if not enemies: # would count as 'completed' on the first frame
+        result['outcome'] = 'no_enemies'
+        result['frames'] = 0
+        frames = 0
+    inputs = make_input(input_kind, frames, seed)
+    start = time.perf_counter()
+    for frame in range(frames):
+        game.step(inputs[frame] if frame < len(inputs) else [], render=False)
+        if not game.enemies:
+            result['outcome'] = 'completed'
+        elif game.dead_timer:
+            result['outcome'] = 'died'
+        if result['outcome'] != 'timeout':
+            result['frames'] = frame + 1
+            break
+    sim_time = time.perf_counter() - start
+
+    result['kills'] = enemies - len(game.enemies)
+    result['hp'] = game.player.hp
+    result['pos'] = [round(game.player.pos[0], 2), round(game.player.pos[1], 2)]
+    result['load_ms'] = round(load_time * 1000, 3)
+    result['sim_fps'] = round(result['frames'] / sim_time) if sim_time and result['frames'] else None
+    result['worker'] = os.getpid()
+    return result
+
+def find_maps(paths):
+    # map files + every .json/.nmap map inside the given directories
+    maps = []
+    for path in paths:
+        if os.path.isdir(path):
+            maps += sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith(('.json', '.nmap')))
+        else:
+            maps.append(path)
+    return maps
+
+def main():
+    parser = argparse.ArgumentParser(description='Play maps headless on a process pool, one JSON line of stats per run')
+    parser.add_argument('maps', nargs='*', default=MAPS, help='map files or directories of maps')
+    parser.add_argument('--runs', type=int, default=1, help='runs per map (each one gets its own seed)')
+    parser.add_argument('--frames', type=int, default=3600, help='max frames per run')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the first run, the others count up from it')
+    parser.add_argument('--input', choices=INPUTS, default='canned')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--out', help='write the JSON lines here instead of stdout')
+    args = parser.parse_args()
+
+    tasks = []
+    for map_path in find_maps(args.maps):
+        for run in range(args.runs):
+            tasks.append((map_path, args.seed + len(tasks), args.frames, args.input))
+
+    out = open(args.out, 'w') if args.out else sys.stdout
+    outcomes = {}
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker) as executor:
+        futures = [executor.submit(play, task) for task in tasks]
+        for future in as_completed(futures): # stream the results as they come in
+            result = future.result()
+            outcomes[result['outcome']] = outcomes.get(result['outcome'], 0) + 1
+            out.write(json.dumps(result) + '\n')
+            out.flush()
+    if args.out:
+        out.close()
+
+    summary = ', '.join(outcome + ' ' + str(count) for outcome, count in sorted(outcomes.items()))
+    print(str(len(tasks)) + ' runs in ' + ('%.1f' % (time.perf_counter() - start)) + 's (' + summary + ')', file=sys.stderr)
+    if outcomes.get('no_enemies'):
+        print('no_enemies: maps without enemy spawners were loaded but not played (nothing to complete)', file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
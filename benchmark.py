@@ -0,0 +1,199 @@
+### Benchmarks the shipped maps (and bigger synthetic copies of them) with a headless, seeded Game
+# python benchmark.py                                -> every shipped map, prints a table
+# python benchmark.py test0.json --scale 10 100      -> also test0.json copied 10x and 100x
+# python benchmark.py --save-baseline bench.json     -> store the results as the baseline
+# python benchmark.py --baseline bench.json          -> exits with 1 if anything got slower/bigger than the baseline by --tolerance
+
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import tempfile
+import tracemalloc
+
+import pygame
+
+from game import Game
+from scripts.tilemap import Tilemap
+
+MAPS = ['map.json', 'map0.json', 'map1.json', 'test.json', 'test0.json', 'test1.json', 'test2.json', 'test3.json']
+
+# metric -> True if bigger is better
+METRICS = {
+    'fps': True,
+    'sim_fps': True,
+    'load_ms': False,
+    'restart_ms': False,
+    'peak_kb': False,
+}
+
+def canned_input(frames):
+    # same input every run: walk right/left, jump every 45 frames, dash every 200 frames
+    inputs = []
+    for frame in range(frames):
+        events = []
+        if frame % 240 == 0:
+            events.append(pygame.event.Event(pygame.KEYDOWN, key=pygame.K_RIGHT))
+        if frame % 240 == 100:
+            events.append(pygame.event.Event(pygame.KEYUP, key=pygame.K_RIGHT))
+            events.append(pygame.event.Event(pygame.KEYDOWN, key=pygame.K_LEFT))
+        if frame % 240 == 200:
+            events.append(pygame.event.Event(pygame.KEYUP, key=pygame.K_LEFT))
+        if frame % 45 == 0:
+            events.append(pygame.event.Event(pygame.KEYDOWN, key=pygame.K_UP))
+        if frame % 200 == 100:
+            events.append(pygame.event.Event(pygame.KEYDOWN, key=pygame.K_x))
+        inputs.append(events)
+    return inputs
+
+def scale_map(path, factor, out_dir):
+    # copies the whole map `factor` times on a grid (spawners included, so there are `factor` times the enemies too)
+    with open(path, 'r') as f:
+        map_data = json.load(f)
+    tile_size = map_data['tile_size']
+
+    xs = [tile['pos'][0] for tile in map_data['tilemap'].values()] or [0]
+    ys = [tile['pos'][1] for tile in map_data['tilemap'].values()] or [0]
+    width = max(xs) - min(xs) + 3
+    height = max(ys) - min(ys) + 3
+    columns = math.ceil(math.sqrt(factor))
+
+    tilemap = {}
+    offgrid = []
+    for copy in range(factor):
+        shift = ((copy % columns) * width, (copy // columns) * height)
+        for tile in map_data['tilemap'].values():
+            if copy and tile['type'] == 'spawners' and tile['variant'] == 0: # only one player
+                continue
+            pos = [tile['pos'][0] + shift[0], tile['pos'][1] + shift[1]]
+            tilemap[str(pos[0]) + ';' + str(pos[1])] = {'type': tile['type'], 'variant': tile['variant'], 'pos': pos}
+        for tile in map_data['offgrid']:
+            if copy and tile['type'] == 'spawners' and tile['variant'] == 0:
+                continue
+            offgrid.append({'type': tile['type'], 'variant': tile['variant'], 'pos': [tile['pos'][0] + shift[0] * tile_size, tile['pos'][1] + shift[1] * tile_size]})
+
+    out_path = os.path.join(out_dir, os.path.splitext(os.path.basename(path))[0] + '_x' + str(factor) + '.json')
+    with open(out_path, 'w') as f:
+        json.dump({'tilemap': tilemap, 'tile_size': tile_size, 'offgrid': offgrid}, f)
+    return out_path
+
+def bench_map(path, frames, seed, load_repeats=5):
+    result = {}
+
+    tilemap = Tilemap(None)
+    tilemap.load(path)
+    result['tiles'] = len(tilemap.tilemap) + len(tilemap.offgrid_tiles)
+
+    # load latency the way the game loads levels (best of a few):
+    #   load_ms    -> nothing prepared yet, the preloader parses/extracts/builds the solid grid, then load_level swaps it in
+    #   restart_ms -> the level is cached (death/restart), load_level only resets the entities
+    game = Game(headless=True, seed=seed, map_name=path)
+    load_times = []
+    restart_times = []
+    for i in range(load_repeats):
+        game.preloader.forget(path)
+        game.enemies = []
+        start = time.perf_counter()
+        game.load_level(path)
+        load_times.append(time.perf_counter() - start)
+
+        game.enemies = []
+        start = time.perf_counter()
+        game.load_level(path)
+        restart_times.append(time.perf_counter() - start)
+    result['load_ms'] = min(load_times) * 1000
+    result['restart_ms'] = min(restart_times) * 1000
+    game.close()
+
+    inputs = canned_input(frames)
+
+    # full frames (simulation + rendering + present to the dummy display)
+    game = Game(headless=True, seed=seed, map_name=path)
+    start = time.perf_counter()
+    for events in inputs:
+        game.step(events)
+    result['fps'] = frames / (time.perf_counter() - start)
+    result['phases'] = {name: stats['p50'] for name, stats in game.profiler.summary().items()}
+    game.close()
+
+    # simulation only
+    game = Game(headless=True, seed=seed, map_name=path)
+    start = time.perf_counter()
+    game.simulate(frames, inputs)
+    result['sim_fps'] = frames / (time.perf_counter() - start)
+    game.close()
+
+    # peak memory (separate run, tracemalloc slows everything down)
+    tracemalloc.start()
+    game = Game(headless=True, seed=seed, map_name=path)
+    for events in inputs[:120]:
+        game.step(events)
+    result['peak_kb'] = tracemalloc.get_traced_memory()[1] / 1024
+    tracemalloc.stop()
+    game.close()
+
+    return result
+
+def compare(results, baseline, tolerance):
+    # returns a list of regression messages (empty = all good)
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        for metric, higher_is_better in METRICS.items():
+            old = baseline[name].get(metric)
+            new = result[metric]
+            if not old:
+                continue
+            change = (new - old) / old
+            if (higher_is_better and change < -tolerance) or ((not higher_is_better) and change > tolerance):
+                regressions.append(name + ' ' + metric + ': ' + ('%.2f' % old) + ' -> ' + ('%.2f' % new) + ' (' + ('%+.0f' % (change * 100)) + '%)')
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark map load/render/simulation speed')
+    parser.add_argument('maps', nargs='*', default=MAPS)
+    parser.add_argument('--frames', type=int, default=600)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--scale', type=int, nargs='*', default=[], help='also bench copies of every map this many times bigger')
+    parser.add_argument('--baseline', help='json file to compare against')
+    parser.add_argument('--save-baseline', help='write the results to this json file')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative change before it counts as a regression')
+    parser.add_argument('--phases', action='store_true', help='also print the p50 of every frame phase')
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        paths = list(args.maps)
+        for factor in args.scale:
+            paths += [scale_map(path, factor, tmp_dir) for path in args.maps]
+
+        print('map'.ljust(22) + 'tiles'.rjust(8) + 'load_ms'.rjust(10) + 'restart_ms'.rjust(12) + 'fps'.rjust(10) + 'sim_fps'.rjust(10) + 'peak_kb'.rjust(10))
+        for path in paths:
+            name = os.path.basename(path)
+            result = bench_map(path, args.frames, args.seed)
+            results[name] = result
+            print(name.ljust(22) + str(result['tiles']).rjust(8) + ('%.2f' % result['load_ms']).rjust(10) + ('%.2f' % result['restart_ms']).rjust(12) + ('%.0f' % result['fps']).rjust(10) + ('%.0f' % result['sim_fps']).rjust(10) + ('%.0f' % result['peak_kb']).rjust(10))
+            if args.phases:
+                print('    ' + '  '.join(phase + ' ' + ('%.3f' % ms) for phase, ms in result['phases'].items()))
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print('REGRESSIONS:')
+            for regression in regressions:
+                print('  ' + regression)
+            sys.exit(1)
+        print('no regressions vs ' + args.baseline)
+
+
+if __name__ == "__main__":
+    main()
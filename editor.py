@@ -4,10 +4,15 @@ import sys
 
 import pygame
 
-from scripts.utils import load_images
+from scripts.assets import AssetAtlas
 from scripts.tilemap import Tilemap
+from scripts.tile_cache import TileChunkCache
+from scripts.autotile import Autotiler, AUTOTILE_TYPES
+from scripts.history import EditHistory, Autosave
+from scripts.present import Presenter
 
-RENDER_SCALE = 2.0
+WINDOW_SIZE = (640, 480)
+INTERNAL_SIZE = (320, 240)
 
 class Editor:
     
@@ -16,26 +21,42 @@ class Editor:
         pygame.init()
 
         pygame.display.set_caption("Ninja Platformer Level Editor")
-        self.screen = pygame.display.set_mode((640, 480)) # the window for the game
-        self.display = pygame.Surface((320, 240)) # stuff to draw on
+        self.presenter = Presenter(WINDOW_SIZE, INTERNAL_SIZE) # scales self.display into the window, only the dirty parts if possible
+        self.screen = self.presenter.screen # the window for the game
+        self.display = pygame.Surface(INTERNAL_SIZE) # stuff to draw on
+        self.last_scroll = None # scroll of the last presented frame (None = next frame gets presented fully)
+        self.last_rects = [] # rects of the cursor preview/current tile img of the last frame (they need redrawing when they move)
+        self.erase_drawn = False # the rect erase outline was on screen last frame
 
         self.clock = pygame.time.Clock()
 
         self.fps = 60 # frame rate (frames per second)
 
-        self.assets = {
-            'decor': load_images('tiles/decor'),
-            'grass': load_images('tiles/grass'),
-            'large_decor': load_images('tiles/large_decor'),
-            'stone': load_images('tiles/stone'),
-            'spawners': load_images('tiles/spawners'),
-        }
+        self.assets = AssetAtlas('editor', {
+            'decor': ('images', 'tiles/decor'),
+            'grass': ('images', 'tiles/grass'),
+            'large_decor': ('images', 'tiles/large_decor'),
+            'stone': ('images', 'tiles/stone'),
+            'spawners': ('images', 'tiles/spawners'),
+        }).load()
 
         self.movement = [False, False, False, False]
         
         self.tilemap = Tilemap(self, tile_size=16)
         self.tilemap.load('map.json') # default is: 'map.json'
 
+        # every edit goes through self.history (undo/redo), the autosave journals it in the background
+        self.autosave = Autosave(self.tilemap, path='autosave', source='map.json')
+        if self.autosave.recover():
+            print("Recovered unsaved edits from the autosave")
+        elif self.autosave.foreign:
+            print("The autosave belongs to another map, leaving it alone (edits won't be autosaved this session)")
+        self.history = EditHistory(self.tilemap, limit=200, autosave=self.autosave)
+
+        self.tile_cache = TileChunkCache(self.tilemap, chunk_size=16) # pre-baked tile chunks, mark dirty whenever the tilemap is edited
+        self.autotiler = Autotiler(self.tilemap) # mark every placed/deleted grid tile, flush() re-autotiles just those spots
+        self.live_autotile = False # autotile while painting (toggle with L)
+
         # try:
         #     self.tilemap.load("map.json")
         # except FileNotFoundError:
@@ -50,9 +71,57 @@ class Editor:
 
         self.left_clicking = False
         self.right_clicking = False
+        self.erase_start = None # world pos where a shift + right click drag (rect erase) started
         self.shift = False
         self.on_grid = True
 
+    def erase_offgrid(self, tiles):
+        # removes a batch of offgrid tiles, the list only gets rebuilt once (list.remove per tile is O(n) each)
+        if not tiles:
+            return
+        removed = set(id(tile) for tile in tiles)
+        indices = [i for i, tile in enumerate(self.tilemap.offgrid_tiles) if id(tile) in removed]
+        for count, i in enumerate(indices): # undo puts them back where they were (keeps the layering)
+            self.history.record_offgrid(self.tilemap.offgrid_tiles[i], False, i - count)
+            self.tile_cache.remove_offgrid(self.tilemap.offgrid_tiles[i])
+        self.tilemap.offgrid_tiles = [tile for tile in self.tilemap.offgrid_tiles if id(tile) not in removed]
+
+    def erase_tile(self, tile_pos):
+        tile_loc = str(tile_pos[0]) + ';' + str(tile_pos[1])
+        if tile_loc in self.tilemap.tilemap:
+            self.history.record_grid(tile_pos, self.tilemap.tilemap.pop(tile_loc), None)
+            self.tile_cache.mark_dirty(tile_pos)
+            self.autotiler.mark(tile_pos)
+
+    def flush_autotile(self):
+        if self.live_autotile:
+            for tile_pos, old_tile in self.autotiler.flush():
+                self.history.record_grid(tile_pos, old_tile, self.tilemap.tilemap[str(tile_pos[0]) + ';' + str(tile_pos[1])])
+                self.tile_cache.mark_dirty(tile_pos)
+
+    def refresh(self, changes):
+        # changes were applied by undo/redo, update the caches
+        for change in changes:
+            if change[0] == 'grid':
+                self.tile_cache.mark_dirty([int(v) for v in change[1].split(';')])
+            elif change[2]:
+                self.tile_cache.add_offgrid(change[1], change[3])
+            else:
+                self.tile_cache.remove_offgrid(change[1])
+
+    def erase_rect(self, world_mpos):
+        # rect between erase_start and the mouse (world pixels)
+        left, top = min(self.erase_start[0], world_mpos[0]), min(self.erase_start[1], world_mpos[1])
+        return pygame.Rect(left, top, abs(world_mpos[0] - self.erase_start[0]) + 1, abs(world_mpos[1] - self.erase_start[1]) + 1)
+
+    def erase_area(self, rect):
+        # deletes every grid tile and offgrid tile touching rect
+        tile_size = self.tilemap.tile_size
+        for x in range(rect.left // tile_size, (rect.right - 1) // tile_size + 1):
+            for y in range(rect.top // tile_size, (rect.bottom - 1) // tile_size + 1):
+                self.erase_tile((x, y))
+        self.erase_offgrid(self.tile_cache.offgrid_in(rect))
+
     def run(self):
         while True:
             # Clear Screen (by filling it with background img (or color))
@@ -66,7 +135,7 @@ class Editor:
             render_scroll = (int(self.scroll[0]), int(self.scroll[1]))
 
             # Render TileMap 
-            self.tilemap.render(self.display, offset=render_scroll)
+            self.tile_cache.render(self.display, offset=render_scroll)
 
             # Get current/active tile
             current_tile_img = self.assets[self.tile_list[self.tile_group]][self.tile_variant].copy()
@@ -74,50 +143,69 @@ class Editor:
 
             # Get tile pos from mouse pos
             mpos = pygame.mouse.get_pos()
-            mpos = (mpos[0] / RENDER_SCALE, mpos[1] / RENDER_SCALE)
+            mpos = self.presenter.to_internal(mpos)
             tile_pos = (int((mpos[0] + self.scroll[0]) // self.tilemap.tile_size), int((mpos[1] + self.scroll[1]) // self.tilemap.tile_size))
 
             # Display placing position in real time
             if self.on_grid:
-                self.display.blit(current_tile_img, (tile_pos[0] * self.tilemap.tile_size - self.scroll[0], tile_pos[1] * self.tilemap.tile_size - self.scroll[1]))
+                preview_r = self.display.blit(current_tile_img, (tile_pos[0] * self.tilemap.tile_size - self.scroll[0], tile_pos[1] * self.tilemap.tile_size - self.scroll[1]))
             else:
-                self.display.blit(current_tile_img, mpos)
+                preview_r = self.display.blit(current_tile_img, mpos)
 
             
             # If left clicking, place tile
             if self.left_clicking and self.on_grid:
-                self.tilemap.tilemap[str(tile_pos[0]) + ';' + str(tile_pos[1])] = {'type': self.tile_list[self.tile_group], 'variant': self.tile_variant, 'pos': tile_pos}
+                tile_loc = str(tile_pos[0]) + ';' + str(tile_pos[1])
+                new_tile = {'type': self.tile_list[self.tile_group], 'variant': self.tile_variant, 'pos': tile_pos}
+                old_tile = self.tilemap.tilemap.get(tile_loc)
+                autotiled = self.live_autotile and old_tile and old_tile['type'] == new_tile['type'] and new_tile['type'] in AUTOTILE_TYPES # variant is up to the autotiler
+                if old_tile != new_tile and not autotiled: # only rebake the chunk if something actually changed
+                    self.tilemap.tilemap[tile_loc] = new_tile
+                    self.history.record_grid(tile_pos, old_tile, new_tile)
+                    self.tile_cache.mark_dirty(tile_pos)
+                    self.autotiler.mark(tile_pos)
             
             # If right clicking and hovering over tile, delete tile
-            if self.right_clicking:
-                tile_loc = str(tile_pos[0]) + ';' + str(tile_pos[1])
-                if tile_loc in self.tilemap.tilemap:
-                    del self.tilemap.tilemap[tile_loc]
-                for tile in self.tilemap.offgrid_tiles.copy():
-                    tile_img = self.assets[tile['type']][tile['variant']]
-                    tile_r = pygame.Rect(tile['pos'][0] - self.scroll[0], tile['pos'][1] - self.scroll[1], tile_img.get_width(), tile_img.get_height())
-                    if tile_r.collidepoint(mpos):
-                        self.tilemap.offgrid_tiles.remove(tile)
+            world_mpos = (mpos[0] + self.scroll[0], mpos[1] + self.scroll[1])
+            if self.right_clicking and not self.erase_start:
+                self.erase_tile(tile_pos)
+                self.erase_offgrid(self.tile_cache.offgrid_at(world_mpos)) # only looks at the tiles in the chunk under the mouse
+
+            # Show the rect erase area while dragging
+            if self.erase_start:
+                erase_r = self.erase_rect(world_mpos)
+                pygame.draw.rect(self.display, (255, 0, 0), erase_r.move(-self.scroll[0], -self.scroll[1]), 1)
 
 
+            # Autotile whatever got painted/erased this frame
+            self.flush_autotile()
+
             # Display img
-            self.display.blit(current_tile_img, (5, 5))
+            icon_r = self.display.blit(current_tile_img, (5, 5))
         
             ## User Input
             for event in pygame.event.get():
                 ## Quit Button
                 if event.type == pygame.QUIT:
+                    self.history.end()
+                    self.autosave.close() # let the journal finish writing
                     pygame.quit()
                     sys.exit()
 
                 if event.type == pygame.MOUSEBUTTONDOWN: # On mouse activation (click or scroll)
                     if event.button == 1: # left click
                         self.left_clicking = True
+                        self.history.begin() # the whole drag is one undo step
                         if not self.on_grid:
                             self.tilemap.offgrid_tiles.append({'type': self.tile_list[self.tile_group], 'variant': self.tile_variant, 'pos': (mpos[0] + self.scroll[0], mpos[1] + self.scroll[1])})
+                            self.tile_cache.add_offgrid(self.tilemap.offgrid_tiles[-1])
+                            self.history.record_offgrid(self.tilemap.offgrid_tiles[-1], True, len(self.tilemap.offgrid_tiles) - 1)
                     
                     if event.button == 3: # right click
                         self.right_clicking = True
+                        self.history.begin()
+                        if self.shift: # shift + right click drag erases everything in a rect
+                            self.erase_start = world_mpos
 
                     if self.shift:
                         if event.button == 4: # scroll up
@@ -140,6 +228,13 @@ class Editor:
                     
                     if event.button == 3: # right click
                         self.right_clicking = False
+                        if self.erase_start:
+                            self.erase_area(self.erase_rect(world_mpos))
+                            self.erase_start = None
+
+                    if event.button in (1, 3) and not (self.left_clicking or self.right_clicking):
+                        self.flush_autotile() # autotiling caused by the drag is part of the same undo step
+                        self.history.end()
 
 
                 if event.type == pygame.KEYDOWN: # On key press/hold
@@ -156,10 +251,33 @@ class Editor:
                         self.movement[3] = True
 
                     if event.key == pygame.K_t:
-                        self.tilemap.autotile()
+                        drawing = self.left_clicking or self.right_clicking # mid drag it just becomes part of the drag's undo step
+                        self.history.begin()
+                        for tile_pos, old_tile in self.autotiler.autotile_all():
+                            self.history.record_grid(tile_pos, old_tile, self.tilemap.tilemap[str(tile_pos[0]) + ';' + str(tile_pos[1])])
+                        if not drawing:
+                            self.history.end()
+                        self.tile_cache.invalidate()
+
+                    if event.key == pygame.K_l: # Toggle live autotiling
+                        self.live_autotile = not self.live_autotile
+                        if self.live_autotile:
+                            self.flush_autotile() # catch up on everything painted while it was off
+                            print("Live autotile on")
+                        else:
+                            print("Live autotile off")
 
                     if event.key == pygame.K_o:
-                        self.tilemap.save('test.json')
+                        self.autosave.save_as('test.json') # written in the background
+                        self.autosave.clear()
+
+                    # NOTE no undo/redo mid drag, it would close the drag's undo step and every tile painted after it would be its own step
+                    drawing = self.left_clicking or self.right_clicking
+                    if event.key == pygame.K_z and event.mod & pygame.KMOD_CTRL and not drawing: # ctrl + z = undo, ctrl + shift + z = redo
+                        self.refresh(self.history.redo() if event.mod & pygame.KMOD_SHIFT else self.history.undo())
+
+                    if event.key == pygame.K_y and event.mod & pygame.KMOD_CTRL and not drawing: # ctrl + y = redo
+                        self.refresh(self.history.redo())
 
                     if event.key == pygame.K_g: # Toggle on_grid
                         self.on_grid = not self.on_grid
@@ -186,8 +304,15 @@ class Editor:
                 
 
             ## Update Screen
-            self.screen.blit(pygame.transform.scale(self.display, self.screen.get_size()), (0, 0))
-            pygame.display.update()
+            # if the camera didn't move and no chunk changed only the cursor preview/current tile img can look different
+            frame_rects = [preview_r.inflate(2, 2), icon_r]
+            if render_scroll != self.last_scroll or self.tile_cache.rebaked or self.erase_start or self.erase_drawn:
+                self.presenter.present(self.display)
+            else:
+                self.presenter.present(self.display, dirty=self.last_rects + frame_rects)
+            self.last_scroll = render_scroll
+            self.last_rects = frame_rects
+            self.erase_drawn = bool(self.erase_start)
             self.clock.tick(self.fps)
 
 editor = Editor()
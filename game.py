@@ -2,71 +2,120 @@
 
 import os
 import sys
+import time
 import pygame
 import random
 import math
 
 from scripts.entities import PhysicsEntity, Player, Enemy, Boss
-from scripts.utils import load_image, load_images, Animation
+from scripts.assets import AssetAtlas, load_sounds
 from scripts.tilemap import Tilemap
+from scripts.tile_cache import TileChunkCache
+from scripts.outline import OutlineRenderer
+from scripts.profiler import FrameProfiler
+from scripts.solid_grid import SolidGrid
+from scripts.binary_map import BinaryMap, MapStreamer
+from scripts.projectiles import ProjectilePool
 from scripts.clouds import Clouds
-from scripts.particle import Particle
-from scripts.spark import Spark
+from scripts.particle_pool import ParticlePool, SparkPool
 from scripts.health_bar import HealthBar
+from scripts.activity import ActivityManager
+from scripts.replay import Recorder, Replayer, check_replay
+from scripts.present import Presenter
+from scripts.governor import QualityGovernor, QUALITY_LEVELS
+from scripts.preload import Level, LevelPreloader
+from scripts.render_queue import RenderQueue
+from scripts.audio import AudioManager
+
+# key -> action, for the arrow key controls (False) and the WASD controls (True)
+KEYMAP = {
+    False: {pygame.K_LEFT: 'left', pygame.K_RIGHT: 'right', pygame.K_UP: 'jump', pygame.K_DOWN: 'down', pygame.K_x: 'dash'},
+    True: {pygame.K_a: 'left', pygame.K_d: 'right', pygame.K_w: 'jump', pygame.K_s: 'down', pygame.K_SPACE: 'dash'},
+}
+
+MAX_CATCH_UP = 5 # max simulation steps per rendered frame when behind (past that the game does slow down instead of freezing)
+MAX_FRAME_TIME = 0.25 # s, longer gaps (window dragged, breakpoint, ...) don't get caught up on
+STEP_SLACK = 0.002 # s, clock.tick sleeps in whole ms, a frame that came in a bit early still counts as a full step (no 0/2/0/2 stutter)
 
 class Game:
     
-    def __init__(self):
-        
+    def __init__(self, headless=False, seed=None, profile_path=None, map_name='test3.json', window_size=(640, 480), internal_size=(320, 240), adaptive_quality=False):
+        # headless: no window/sound device (SDL dummy drivers), use simulate() instead of run()
+        # seed: makes a run reproducible (same seed + same inputs = same game)
+        # profile_path: dump the per-phase frame timings here (.csv or .json) when the game quits
+        # map_name: map to load when self.testing is on
+        # window_size/internal_size: size of the window and of the (pixel art) surfaces everything gets drawn on
+        # adaptive_quality: let a QualityGovernor turn down particles/outlines/clouds when frames get slow (run() only)
+        self.headless = headless
+        if self.headless:
+            os.environ['SDL_VIDEODRIVER'] = 'dummy'
+            os.environ['SDL_AUDIODRIVER'] = 'dummy'
+
+        self.rng = random.Random(seed) # all gameplay randomness in here goes through self.rng
+        self.render_rng = random.Random(seed) # purely visual randomness (screenshake), so drawing or not doesn't change the game
+        if seed is not None:
+            random.seed(seed) # for the scripts/ modules that still use the random module directly
+
         pygame.init()
 
         pygame.display.set_caption("Ninja Platformer Test Game")
-        self.screen = pygame.display.set_mode((640, 480)) # the window for the game
-        self.display = pygame.Surface((320, 240), pygame.SRCALPHA) # stuff to draw on
-        self.display_2 = pygame.Surface((320, 240))
+        self.presenter = Presenter(window_size, internal_size) # scales self.display_2 into the window (see scripts/present.py)
+        self.screen = self.presenter.screen # the window for the game
+        self.display = pygame.Surface(internal_size, pygame.SRCALPHA) # stuff to draw on
+        self.display_2 = pygame.Surface(internal_size)
+        self.outline = OutlineRenderer(self.display.get_size()) # moving stuff that needs an outline goes on self.outline.layer
+        # sprites get queued per surface and go out in one blits() call each (flushed before anything draws on top of them directly)
+        self.render_queue = RenderQueue()
+        self.back_layer = self.render_queue.layer(self.display_2)
+        self.front_layer = self.render_queue.layer(self.display)
+        self.entity_layer = self.render_queue.layer(self.outline.layer)
 
         self.clock = pygame.time.Clock()
 
         self.fps = 60 # frame rate (frames per second)
 
-        self.assets = {
-            'decor': load_images('tiles/decor'),
-            'grass': load_images('tiles/grass'),
-            'large_decor': load_images('tiles/large_decor'),
-            'stone': load_images('tiles/stone'),
-            'player': load_image('entities/player.png'),
-            'background': load_image('background.png'),
-            'clouds': load_images('clouds'),
-            'enemy/idle': Animation(load_images('entities/enemy/idle'), img_dur=6),
-            'enemy/run': Animation(load_images('entities/enemy/run'), img_dur=4),
-            'player/idle': Animation(load_images('entities/player/idle'), img_dur=6),
-            'player/jump': Animation(load_images('entities/player/jump')),
-            'player/run': Animation(load_images('entities/player/run'), img_dur=4),
-            'player/slide': Animation(load_images('entities/player/slide')),
-            'player/wall_slide': Animation(load_images('entities/player/wall_slide')),
-            'boss/idle':Animation(load_images('entities/boss/idle')),
-            'boss/run':Animation(load_images('entities/boss/run')),
-            'boss/jump':Animation(load_images('entities/boss/jump')),
-            'boss/slash':Animation(load_images('entities/boss/slash')),
-            'particles/leaf': Animation(load_images('particles/leaf'), img_dur=20, loop=False),
-            'particles/particle': Animation(load_images('particles/particle'), img_dur=6, loop=False),
-            'gun': load_image('gun.png'),
-            'gun2': pygame.transform.flip(pygame.transform.scale(load_image('gun2.png'), (8, 4)), True, False),
-            'projectile': load_image('projectile.png'),
-        }
-
-        self.sfx = {
-            'jump': pygame.mixer.Sound('data/sfx/jump.wav'),
-            'dash': pygame.mixer.Sound('data/sfx/dash.wav'),
-            'hit': pygame.mixer.Sound('data/sfx/hit.wav'),
-            'death': pygame.mixer.Sound('data/sfx/death.wav'),
-            'shoot1': pygame.mixer.Sound('data/sfx/shoot1.wav'),
-            'shoot2': pygame.mixer.Sound('data/sfx/shoot2.wav'),
-            'ambience': pygame.mixer.Sound('data/sfx/ambience.wav'),
-            'slash1': pygame.mixer.Sound('data/sfx/slash1.wav'),
-            'slash2': pygame.mixer.Sound('data/sfx/slash2.wav'),
-            'slash3': pygame.mixer.Sound('data/sfx/slash3.wav'),
-        }
+        # sounds decode on a thread pool while the images load
+        sfx = load_sounds({
+            'jump': 'data/sfx/jump.wav',
+            'dash': 'data/sfx/dash.wav',
+            'hit': 'data/sfx/hit.wav',
+            'death': 'data/sfx/death.wav',
+            'shoot1': 'data/sfx/shoot1.wav',
+            'shoot2': 'data/sfx/shoot2.wav',
+            'ambience': 'data/sfx/ambience.wav',
+            'slash1': 'data/sfx/slash1.wav',
+            'slash2': 'data/sfx/slash2.wav',
+            'slash3': 'data/sfx/slash3.wav',
+        })
+
+        # all images come out of one cached atlas (see scripts/assets.py for the spec format)
+        self.assets = AssetAtlas('game', {
+            'decor': ('images', 'tiles/decor'),
+            'grass': ('images', 'tiles/grass'),
+            'large_decor': ('images', 'tiles/large_decor'),
+            'stone': ('images', 'tiles/stone'),
+            'player': ('image', 'entities/player.png'),
+            'background': ('image', 'background.png'),
+            'clouds': ('images', 'clouds'),
+            'enemy/idle': ('animation', 'entities/enemy/idle', {'img_dur': 6}),
+            'enemy/run': ('animation', 'entities/enemy/run', {'img_dur': 4}),
+            'player/idle': ('animation', 'entities/player/idle', {'img_dur': 6}),
+            'player/jump': ('animation', 'entities/player/jump'),
+            'player/run': ('animation', 'entities/player/run', {'img_dur': 4}),
+            'player/slide': ('animation', 'entities/player/slide'),
+            'player/wall_slide': ('animation', 'entities/player/wall_slide'),
+            'boss/idle': ('animation', 'entities/boss/idle'),
+            'boss/run': ('animation', 'entities/boss/run'),
+            'boss/jump': ('animation', 'entities/boss/jump'),
+            'boss/slash': ('animation', 'entities/boss/slash'),
+            'particles/leaf': ('animation', 'particles/leaf', {'img_dur': 20, 'loop': False}),
+            'particles/particle': ('animation', 'particles/particle', {'img_dur': 6, 'loop': False}),
+            'gun': ('image', 'gun.png'),
+            'gun2': ('image', 'gun2.png', {'scale': (8, 4), 'flip': (True, False)}),
+            'projectile': ('image', 'projectile.png', {'outline': True}), # + 'projectile/outline'
+        }).load()
+
+        self.sfx = {name: sound.result() for name, sound in sfx.items()}
 
         self.sfx['slash1'].set_volume(0.5)
         self.sfx['slash2'].set_volume(0.6)
@@ -79,20 +128,32 @@ class Game:
         self.sfx['dash'].set_volume(0.3)
         self.sfx['jump'].set_volume(0.7)
 
+        # every .play() goes through the AudioManager from here on (voice limits, one play per sound per frame, distance falloff)
+        self.audio = AudioManager(self.sfx)
+        self.audio.muted = self.audio.muted or self.headless
+        self.sfx = self.audio.proxies()
+
         self.clouds = Clouds(self.assets['clouds'], count=32)
+        self.all_clouds = list(self.clouds.clouds) # the governor can hide some of them
+        self.quality = QUALITY_LEVELS[0] # see apply_quality
 
         self.player = Player(self, (50, 50), (8, 15))
         
         self.tilemap = Tilemap(self, tile_size=16)
+        self.tile_cache = TileChunkCache(self.tilemap, chunk_size=16, outline=True) # pre-baked tile chunks + their outlines (rebuilt on load_level)
+        self.solid_grid = SolidGrid(self.tilemap) # int indexed solid tiles for fast collision checks (rebuilt on load_level)
+        self.map_stream = None # only for binary (.nmap) maps, loads map chunks as the player gets close to them
+        self.preloader = LevelPreloader(self) # json maps get parsed/preprocessed in the background (see scripts/preload.py)
 
         self.screenshake = 0
             
         # weird vars bc need to be initialized before self.run()
         self.enemies = []
+        self.activity = ActivityManager(wake_radius=540, sleep_radius=600) # only enemies near the player get updated (540px ~ how far a bullet flies)
         self.transition = -30
         self.dead_timer = 0
 
-        self.map_name = 'test3.json' # or map.json
+        self.map_name = map_name # or map.json
         # self.map_id = 0
         self.testing = True
 
@@ -109,25 +170,52 @@ class Game:
 
         self.use_wasd = False
 
+        self.running = True
+        self.recorder = None # Recorder that gets every press/release (see scripts/replay.py)
+        self.replayer = None # Replayer that feeds run() its inputs instead of the keyboard
+
+        self.profile_path = profile_path
+        self.profiler = FrameProfiler(trace_len=100000 if profile_path else 0) # times every phase of the frame (F3 toggles the overlay), per frame trace only when it gets dumped
+        self.governor = QualityGovernor(1000 / self.fps) if adaptive_quality else None
+        self.show_profiler = False
+
         print("Controls start as arrow keys")
 
     def load_level(self, map_id):
         if self.testing:
-            self.tilemap.load(map_id) # load map (for testing)
+            map_path = map_id # load map (for testing)
+        else:
+            map_path = 'data/maps/' + str(map_id) + '.json' # load map (actual level)
+        self.map_path = map_path
+
+        if self.map_stream:
+            self.map_stream.map.close()
+            self.map_stream = None
+        if map_path.endswith('.nmap'):
+            self.map_stream = MapStreamer(BinaryMap(map_path), self.tilemap) # only loads spawners/decor for now, chunks get streamed in (see update)
+            level = Level(self.tilemap) # (own SolidGrid, made once the first chunks are in, see below)
         else:
-            self.tilemap.load('data/maps/' + str(map_id) + '.json') # load map (actual level)
+            level = self.preloader.get(map_path) # already prepared in the background (or cached, when restarting)
+            if self.tilemap.tilemap is not level.tilemap: # restarting the same level keeps the baked tile chunks
+                self.tilemap.tilemap = level.tilemap
+                self.tilemap.offgrid_tiles = level.offgrid
+                self.tilemap.tile_size = level.tile_size
+                self.tile_cache.invalidate()
+            self.solid_grid = level.solid_grid
+            self.solid_grid.tilemap = self.tilemap
+
+        if not self.testing: # get the next level ready while this one is played
+            self.preloader.request('data/maps/' + str(min(map_id + 1, self.preloader.level_count() - 1)) + '.json')
 
         self.healthbars = []
 
         # reset all entities and particles
-        self.leaf_spawners = [] # for particle effects
-        for tree in self.tilemap.extract([('large_decor', 2)], keep=True):
-            self.leaf_spawners.append(pygame.Rect(4 + tree['pos'][0], 4 + tree['pos'][1], 23, 13))
+        self.leaf_spawners = level.leaf_spawners # for particle effects
 
         # self.enemies = []
-        for spawner in self.tilemap.extract([('spawners', 0), ('spawners', 1), ('spawners', 2)]):
+        for spawner in level.spawners:
             if spawner['variant'] == 0: # spawner is for player
-                self.player.pos = spawner['pos']
+                self.player.pos = list(spawner['pos']) # copy, the level's spawners get reused on restart
                 self.player.air_time = 0
                 self.healthbars.append(HealthBar(self, self.player, color=(0, 255, 0), shrink_factor=5))
             elif spawner['variant'] == 1: # spawner is for enemy
@@ -138,10 +226,21 @@ class Game:
                 boss = Boss(self, spawner['pos'], size=(8, 15))
                 self.enemies.append(boss)
                 self.healthbars.append(HealthBar(self, boss, color=(255, 0, 0), shrink_factor=5))
+
+        self.activity.reset(self.enemies)
+        self.entity_healthbars = {id(healthbar.entity): healthbar for healthbar in self.healthbars}
+
+        if self.map_stream: # enemies need the ground under them loaded from the start
+            for enemy in self.enemies:
+                self.map_stream.load_around(enemy.pos, radius=1)
+            self.map_stream.load_around(self.player.rect().center)
+            self.tile_cache.invalidate()
+            self.solid_grid = SolidGrid(self.tilemap) # streamed chunks get added to it (see update)
         
-        self.projectiles = []
-        self.particles = []
-        self.sparks = []
+        self.projectiles = ProjectilePool() # bullets
+        self.particles = ParticlePool(self) # fixed capacity, see scripts/particle_pool.py
+        self.particles.density = self.quality['particles']
+        self.sparks = SparkPool()
 
         self.scroll = [0,0]
         self.dead_timer = 0
@@ -157,6 +256,33 @@ class Game:
         ]
 
 
+    def apply_quality(self, settings):
+        # settings = one of the QUALITY_LEVELS (see scripts/governor.py), only changes how things look
+        self.quality = settings
+        self.particles.density = settings['particles']
+        self.clouds.clouds = self.all_clouds[:int(len(self.all_clouds) * settings['clouds'])]
+
+    def new_run(self, level, seed=None, testing=True):
+        # starts over on another map with a fresh player/rng, without rebuilding the window or assets (see batch.py)
+        # level = map path if testing, level number otherwise
+        self.rng.seed(seed)
+        self.render_rng.seed(seed)
+        if seed is not None:
+            random.seed(seed)
+
+        self.player = Player(self, (50, 50), (8, 15))
+        self.enemies = []
+        self.movement = [False, False]
+        self.screenshake = 0
+        self.dead_timer = 0
+        self.running = True
+
+        self.testing = testing
+        if testing:
+            self.map_name = level
+        self.level = level
+        self.load_level(self.level)
+
     def run(self):
         pygame.mixer.music.load('data/music.wav')
         pygame.mixer.music.set_volume(0.5)
@@ -164,217 +290,381 @@ class Game:
 
         self.sfx['ambience'].play(-1)
 
-        while True:
-            self.display.fill((0, 0, 0, 0)) # everything rendered with this will have an outline (and rendered in the front/on self.display_2)
-            # Clear Screen (by filling it with background img (or color))
-            self.display_2.blit(self.assets['background'], (0, 0)) # anything rendered with this will have no outline (but rendered in the back/behind self.display)
-
-            self.screenshake = max(0, self.screenshake - 1)
-
-            if not len(self.enemies): # if all enemies are dead
-                self.transition += 1
-                if self.transition > 30:
-                    if self.testing:
-                        self.load_level(self.level) # restart
-                    else:
-                        self.level = min(self.level + 1, len(os.listdir('data/maps')) - 1)
-                        self.load_level(self.level) # move to next level
-            if self.transition < 0:
-                self.transition += 1
-
-            if self.dead_timer:
-                self.dead_timer += 1
-                if self.dead_timer >= 10:
-                    self.transition = min(30, self.transition + 1)
-                if self.dead_timer > 40:
-                    self.load_level(self.level)
-
-            # Update scroll
-            self.scroll[0] += (self.player.rect().centerx - self.display.get_width() / 2 - self.scroll[0]) / 30
-            self.scroll[1] += (self.player.rect().centery - self.display.get_height() / 2 - self.scroll[1]) / 30
-            render_scroll = (int(self.scroll[0]), int(self.scroll[1]))
-
-            # Spawn particles (not rendered yet)
-            for rect in self.leaf_spawners:
-                if random.random() * 29999 < rect.width * rect.height: # produces a random chance to spawn particles
-                    pos = (rect.x + random.random() * rect.width, rect.y + random.random() * rect.height)
-                    self.particles.append(Particle(self, 'leaf', pos, velocity=[random.choice([-.1, .1]), 0.3], frame=random.randint(0, 20)))
-            
-            # Render clouds before tiles
-            self.clouds.update()
-            self.clouds.render(self.display_2, offset=render_scroll)
-
-            # Render tiles before physics entities
-            self.tilemap.render(self.display, offset=render_scroll)
-
-            # Update/Render Enemies before player
-            for enemy in self.enemies.copy():
-                kill = True if (enemy.hp <= 0) else False
-                enemy.update(self.tilemap, (0,  0))
-                enemy.render(self.display, offset=render_scroll)
-                if kill:
-                    self.enemies.remove(enemy)
-                    self.sparks.append(Spark(enemy.rect().center, 0, 5 + random.random()))
-                    self.sparks.append(Spark(enemy.rect().center, math.pi, 5 + random.random()))
-
-            # Update/Render player
-            if not self.dead_timer:
-                self.player.update(self.tilemap, (self.movement[1] - self.movement[0], 0)) # (self.movement[1]-self.movement[0] is change to X axis, 0 is change to Y axis)
-                self.player.render(self.display, offset=render_scroll)
-                # self.player.render_hp_bar(self.display_2, offset=render_scroll)
-
-            # Update/Render projectiles (bullets) NOTE projectile format: projectile = [[x, y], direction, timer, dmg]
-            for projectile in self.projectiles.copy():
-                projectile[0][0] += projectile[1] # changes projectile_x by direction
-                projectile[2] += 1 # progresses timer
-                
-                # display the bullet
-                img = self.assets['projectile']
-                self.display.blit(img, (projectile[0][0] - img.get_width() / 2 - render_scroll[0], projectile[0][1] - img.get_height() / 2 - render_scroll[1]))
-                
-                # check if bullet hits wall
-                if self.tilemap.solid_check(projectile[0]):
-                    self.projectiles.remove(projectile) # deletes bullet if hits wall
-                    for i in range(4):
-                        self.sparks.append(Spark(projectile[0], random.random() - 0.5 + (math.pi if projectile[1] > 0 else 0), 2 + random.random())) # the + math.pi will make the spark go left instead of right
-                elif projectile[2] > 360: # or if timer is greater than 360 (6 seconds)
-                    self.projectiles.remove(projectile)
-                elif abs(self.player.dashing) < 50: # or player is not actively dashing
-                    if self.player.rect().collidepoint(projectile[0]): # and hits player
-                        self.sfx['hit'].play()
-                        self.projectiles.remove(projectile)
-                        self.player.hp -= projectile[3] # projectile[3] should be the dmg of the projectile
-                        self.screenshake = max(16, self.screenshake) # add screenshake
-                        # update hp bar
-                        self.player.hpbar_render_points = [
-                            (10, self.display.get_height() - 20),
-                            (10 + self.player.hp, self.display.get_height() - 20),
-                            (10 + self.player.hp, self.display.get_height() - 10),
-                            (10, self.display.get_height() - 10),
-                        ]
-                        if self.player.hp <= 0:
-                            self.sfx['death'].play()
-                            self.dead_timer += 1
-                            spark_amount = 30
-                        else:
-                            spark_amount = random.randint(5, 10)
-                        for i in range(spark_amount): # 30 SPARKS??? ... yes
-                                angle = random.random() * math.pi * 2
-                                speed = random.random() * 5
-                                self.sparks.append(Spark(self.player.rect().center, angle, 2 + random.random()))
-                                self.particles.append(Particle(self, 'particle', self.player.rect().center, velocity=[math.cos(angle + math.pi) * speed * 0.5, math.sin(angle + math.pi) * speed], frame=random.randint(0, 7)))
-
-            # Update/Render Sparks
-            for spark in self.sparks.copy():
-                kill = spark.update()
-                spark.render(self.display, offset=render_scroll)
-                if kill:
-                    self.sparks.remove(spark)
-
-            display_mask = pygame.mask.from_surface(self.display)
-            display_sillhouette = display_mask.to_surface(setcolor=(0, 0, 0, 180), unsetcolor=(0, 0, 0, 0))
-            for offset in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
-                self.display_2.blit(display_sillhouette, offset)
-
-            # Update/Render Healthbars
-            for healthbar in self.healthbars.copy():
-                if not healthbar.entity.hp <= 0:
-                    healthbar.update()
-                    healthbar.render(self.display, render_scroll)
-
-            # Update/Render Particles
-            for particle in self.particles.copy():
-                kill = particle.update()
-                particle.render(self.display, offset=render_scroll)
-                if particle.type == 'leaf':
-                    particle.pos[0] += math.sin(particle.animation.frame * 0.035) * 0.3
-                if kill:
-                    self.particles.remove(particle)
-
-
-            ## ----------------------------------------User Input---------------------------------------- ##
-            for event in pygame.event.get():
-                ## Quit Button
-                if event.type == pygame.QUIT:
-                    pygame.quit()
-                    sys.exit()
-                if event.type == pygame.KEYDOWN: # On key press/hold
-                    if not self.use_wasd:
-                        if event.key == pygame.K_LEFT: # move left
-                            self.movement[0] = True
-                        
-                        if event.key == pygame.K_RIGHT: # move right
-                            self.movement[1] = True
-
-                        if event.key == pygame.K_UP: # jump
-                            if self.player.jump():
-                                self.sfx['jump'].play()
-
-                        if event.key == pygame.K_DOWN: # force down
-                            self.player.gravity_vel_change = 0.3
-
-                        if event.key == pygame.K_x: # dash
-                            self.player.dash()
-
-                    else:
-                        if event.key == pygame.K_a: # move left
-                            self.movement[0] = True
-                        
-                        if event.key == pygame.K_d: # move right
-                            self.movement[1] = True
-
-                        if event.key == pygame.K_w: # jump
-                            if self.player.jump():
-                                self.sfx['jump'].play()
-
-                        if event.key == pygame.K_s: # force down
-                            self.player.gravity_vel_change = 0.3
-
-                        if event.key == pygame.K_SPACE: # dash
-                            self.player.dash()
-
-                    if event.key == pygame.K_c: # toggle controls
-                        self.use_wasd = not self.use_wasd
-                        self.movement[0] = False
-                        self.movement[1] = False
-                        if self.use_wasd:
-                            print("Controls changed to WASD")
-                        else:
-                            print("Controls changed to arrow keys")
-                if event.type == pygame.KEYUP: # On key release
-                    if not self.use_wasd:
-                        if event.key == pygame.K_LEFT: # move left
-                            self.movement[0] = False
-                        
-                        if event.key == pygame.K_RIGHT: # move right
-                            self.movement[1] = False
-
-                        if event.key == pygame.K_DOWN: # force down
-                            self.player.gravity_vel_change = 0.1
-
-                    else:
-                        if event.key == pygame.K_a: # move left
-                            self.movement[0] = False
-                        
-                        if event.key == pygame.K_d: # move right
-                            self.movement[1] = False
-
-                        if event.key == pygame.K_s: # force down
-                            self.player.gravity_vel_change = 0.1
-                
-            if self.transition:
-                transition_surf = pygame.Surface(self.display.get_size())
-                pygame.draw.circle(transition_surf, (255, 255, 255), (self.display.get_width() // 2, self.display.get_height() // 2), (30 - abs(self.transition)) * 8)
-                transition_surf.set_colorkey((255, 255, 255)) # makes the circle on the transition_surf transparent
-                self.display.blit(transition_surf, (0, 0))
-
-            self.display_2.blit(self.display, (0, 0))
-
-            ## Update Screen
-            screenshake_offset = (random.random() * self.screenshake - self.screenshake / 2, random.random() * self.screenshake - self.screenshake / 2)
-            self.screen.blit(pygame.transform.scale(self.display_2, self.screen.get_size()), screenshake_offset)
-            pygame.display.update()
-            self.clock.tick(self.fps)
-
+        # fixed timestep: the simulation always runs at self.fps steps per second, if a frame took too long the next one
+        # runs a few extra steps (without drawing them) to catch up instead of the whole game going into slow motion
+        step_time = 1 / self.fps
+        accumulator = step_time
+        while self.running:
+            start = time.perf_counter()
+            steps = 0
+            while accumulator >= step_time - STEP_SLACK and steps < MAX_CATCH_UP:
+                accumulator -= step_time
+                steps += 1
+                events = pygame.event.get() if steps == 1 else []
+                if self.replayer: # the keyboard only gets to quit/toggle the overlay
+                    events = self.replayer.frame_input(events)
+                self.step(events, render=accumulator < step_time - STEP_SLACK or steps == MAX_CATCH_UP) # only the last step gets drawn
+            if accumulator >= step_time: # still behind after MAX_CATCH_UP steps, drop the rest
+                accumulator = 0
+
+            if self.governor and steps and self.governor.record((time.perf_counter() - start) * 1000):
+                self.apply_quality(self.governor.settings())
 
-Game().run() # begins running the game
\ No newline at end of file
+            self.clock.tick(self.fps)
+            accumulator += min(time.perf_counter() - start, MAX_FRAME_TIME)
+
+        if self.recorder:
+            self.recorder.save()
+        if self.profile_path:
+            self.profiler.dump(self.profile_path)
+        self.close()
+        pygame.quit()
+        sys.exit()
+
+    def close(self):
+        # stops the background threads (audio worker, level preloader) and the map stream, the Game can't be used after this
+        self.audio.close()
+        self.preloader.close()
+        if self.map_stream:
+            self.map_stream.map.close()
+            self.map_stream = None
+
+    def simulate(self, frames, inputs=()):
+        # Headless/fast mode: steps the game as fast as possible without rendering (or waiting on the clock)
+        # inputs is a scripted input stream: one list of pygame events per frame (runs out -> no more input)
+        inputs = iter(inputs)
+        for frame in range(frames):
+            if not self.running:
+                return frame
+            self.step(next(inputs, []), render=False)
+        return frames
+
+    def step(self, events, render=True):
+        # one frame: simulation, then drawing + updating the screen, then the input for the next frame
+        self.update()
+        if render:
+            self.render()
+            self.present()
+
+        ## ----------------------------------------User Input---------------------------------------- ##
+        self.profiler.start('input')
+        for event in events:
+            self.handle_event(event)
+        if self.recorder:
+            self.recorder.end_frame()
+        self.profiler.stop('input')
+
+        self.profiler.start('audio')
+        self.audio.end_frame((self.scroll[0] + self.display.get_width() / 2, self.scroll[1] + self.display.get_height() / 2))
+        self.profiler.stop('audio')
+
+        self.profiler.end_frame()
+
+    def present(self):
+        ## Update Screen
+        self.profiler.start('present')
+        screenshake_offset = (self.render_rng.random() * self.screenshake - self.screenshake / 2, self.render_rng.random() * self.screenshake - self.screenshake / 2)
+        self.presenter.present(self.display_2, screenshake_offset)
+        self.profiler.stop('present')
+
+    def update(self):
+        self.profiler.start('transition')
+        self.screenshake = max(0, self.screenshake - 1)
+
+        if not len(self.enemies): # if all enemies are dead
+            self.transition += 1
+            if self.transition > 30:
+                if self.testing:
+                    self.load_level(self.level) # restart
+                else:
+                    self.level = min(self.level + 1, self.preloader.level_count() - 1)
+                    self.load_level(self.level) # move to next level
+        if self.transition < 0:
+            self.transition += 1
+
+        if self.dead_timer:
+            self.dead_timer += 1
+            if self.dead_timer >= 10:
+                self.transition = min(30, self.transition + 1)
+            if self.dead_timer > 40:
+                self.load_level(self.level)
+
+        self.profiler.stop('transition')
+
+        # Update scroll
+        self.scroll[0] += (self.player.rect().centerx - self.display.get_width() / 2 - self.scroll[0]) / 30
+        self.scroll[1] += (self.player.rect().centery - self.display.get_height() / 2 - self.scroll[1]) / 30
+
+        # Stream in the map chunks around the player (binary maps only)
+        if self.map_stream:
+            new_chunks = self.map_stream.load_around(self.player.rect().center)
+            if new_chunks:
+                chunk_px = self.map_stream.chunk_px()
+                for chunk_loc, tiles in new_chunks.items():
+                    self.tile_cache.mark_dirty_rect(pygame.Rect(chunk_loc[0] * chunk_px, chunk_loc[1] * chunk_px, chunk_px, chunk_px))
+                    self.solid_grid.add_tiles(tiles.values()) # only the new cells, no rebuild
+
+        # Spawn particles (not rendered yet)
+        self.profiler.start('particles')
+        for rect in self.leaf_spawners:
+            if self.rng.random() * 29999 < rect.width * rect.height: # produces a random chance to spawn particles
+                pos = (rect.x + self.rng.random() * rect.width, rect.y + self.rng.random() * rect.height)
+                self.particles.spawn('leaf', pos, velocity=[self.rng.choice([-.1, .1]), 0.3], frame=self.rng.randint(0, 20))
+        self.profiler.stop('particles')
+
+        self.profiler.start('clouds')
+        self.clouds.update()
+        self.profiler.stop('clouds')
+
+        # Update Enemies before player
+        self.profiler.start('enemies')
+        self.profiler.count('enemies', len(self.enemies))
+        for enemy in self.activity.update(self.player.rect().center).copy(): # far away enemies are asleep (frozen), see scripts/activity.py
+            kill = True if (enemy.hp <= 0) else False
+            self.audio.emitter = enemy.pos # sounds the enemy makes get quieter the further away it is
+            enemy.update(self.tilemap, (0,  0))
+            self.activity.moved(enemy)
+            if kill:
+                self.enemies.remove(enemy)
+                self.activity.remove(enemy)
+                self.sparks.spawn(enemy.rect().center, 0, 5 + self.rng.random())
+                self.sparks.spawn(enemy.rect().center, math.pi, 5 + self.rng.random())
+        self.audio.emitter = None
+        self.profiler.stop('enemies')
+
+        # Update player
+        self.profiler.start('player')
+        if not self.dead_timer:
+            self.player.update(self.tilemap, (self.movement[1] - self.movement[0], 0)) # (self.movement[1]-self.movement[0] is change to X axis, 0 is change to Y axis)
+        self.profiler.stop('player')
+
+        # Update projectiles (bullets) NOTE projectiles live in a ProjectilePool (see scripts/projectiles.py), not a list
+        self.profiler.start('projectiles')
+        self.profiler.count('projectiles', len(self.projectiles))
+        wall_hits, player_hits = self.projectiles.update(self.solid_grid, self.player.rect(), player_vulnerable=abs(self.player.dashing) < 50) # player can't get hit while actively dashing
+
+        # bullets that hit a wall
+        for pos, direction in wall_hits:
+            for i in range(4):
+                self.sparks.spawn(pos, self.rng.random() - 0.5 + (math.pi if direction > 0 else 0), 2 + self.rng.random()) # the + math.pi will make the spark go left instead of right
+
+        # bullets that hit the player
+        for pos, dmg in player_hits:
+            self.sfx['hit'].play()
+            self.player.hp -= dmg
+            self.screenshake = max(16, self.screenshake) # add screenshake
+            # update hp bar
+            self.player.hpbar_render_points = [
+                (10, self.display.get_height() - 20),
+                (10 + self.player.hp, self.display.get_height() - 20),
+                (10 + self.player.hp, self.display.get_height() - 10),
+                (10, self.display.get_height() - 10),
+            ]
+            if self.player.hp <= 0:
+                self.sfx['death'].play()
+                self.dead_timer += 1
+                spark_amount = 30
+            else:
+                spark_amount = self.rng.randint(5, 10)
+            for i in range(spark_amount): # 30 SPARKS??? ... yes
+                    angle = self.rng.random() * math.pi * 2
+                    speed = self.rng.random() * 5
+                    self.sparks.spawn(self.player.rect().center, angle, 2 + self.rng.random())
+                    self.particles.spawn('particle', self.player.rect().center, velocity=[math.cos(angle + math.pi) * speed * 0.5, math.sin(angle + math.pi) * speed], frame=self.rng.randint(0, 7))
+        self.profiler.stop('projectiles')
+
+        # Update Sparks
+        self.profiler.start('sparks')
+        self.profiler.count('sparks', len(self.sparks))
+        self.sparks.update()
+        self.profiler.stop('sparks')
+
+        # Update Healthbars
+        self.profiler.start('healthbars')
+        self.profiler.count('healthbars', len(self.healthbars))
+        for entity in [self.player] + self.activity.active: # healthbars of sleeping enemies are frozen too
+            healthbar = self.entity_healthbars.get(id(entity))
+            if healthbar and not healthbar.entity.hp <= 0:
+                healthbar.update()
+        self.profiler.stop('healthbars')
+
+        # Update Particles (leaf sway happens inside ParticlePool.update)
+        self.profiler.start('particles')
+        self.profiler.count('particles', len(self.particles))
+        self.particles.update()
+        self.profiler.stop('particles')
+
+    def render(self):
+        self.display.fill((0, 0, 0, 0)) # everything rendered with this will be rendered in the front/on self.display_2
+        self.outline.clear() # everything rendered on self.outline.layer will have an outline (tiles get theirs from the tile cache)
+        # Clear Screen (by filling it with background img (or color))
+        self.back_layer.blit(self.assets['background'], (0, 0)) # anything rendered with this will have no outline (but rendered in the back/behind self.display)
+
+        render_scroll = (int(self.scroll[0]), int(self.scroll[1]))
+        visible = self.activity.visible(pygame.Rect(render_scroll[0] - 16, render_scroll[1] - 16, self.display.get_width() + 32, self.display.get_height() + 32)) # enemies on screen (+ a margin for sprites/healthbars sticking out)
+
+        # Render clouds before tiles
+        self.profiler.start('clouds')
+        self.clouds.render(self.back_layer, offset=render_scroll)
+        self.profiler.stop('clouds')
+
+        # Render tiles before physics entities
+        self.profiler.start('tiles')
+        self.tile_cache.render(self.front_layer, offset=render_scroll)
+        if self.quality['outline']:
+            self.tile_cache.render_outline(self.back_layer, offset=render_scroll)
+        self.profiler.stop('tiles')
+
+        # Render Enemies before player
+        self.profiler.start('enemies')
+        for enemy in visible:
+            enemy.render(self.entity_layer, offset=render_scroll)
+        self.profiler.stop('enemies')
+
+        # Render player
+        self.profiler.start('player')
+        if not self.dead_timer:
+            self.player.render(self.entity_layer, offset=render_scroll)
+            # self.player.render_hp_bar(self.display_2, offset=render_scroll)
+        self.profiler.stop('player')
+
+        # Everything so far goes out now (sparks are polygons and have to end up on top of the entities)
+        self.profiler.start('flush')
+        self.render_queue.flush()
+        self.profiler.stop('flush')
+
+        # Render sparks
+        self.profiler.start('sparks')
+        self.sparks.render(self.outline.layer, offset=render_scroll)
+        self.profiler.stop('sparks')
+
+        # Outline the moving stuff, then put it in front of the tiles
+        self.profiler.start('outline')
+        if self.quality['outline']:
+            self.outline.render(self.display_2)
+        self.display.blit(self.outline.layer, (0, 0))
+        self.profiler.stop('outline')
+
+        # Render projectiles (on top of the entities, their outline comes pre-made from the atlas)
+        self.profiler.start('projectiles')
+        if self.quality['outline']:
+            self.projectiles.render(self.back_layer, self.assets['projectile/outline'], offset=render_scroll)
+        self.projectiles.render(self.front_layer, self.assets['projectile'], offset=render_scroll)
+        self.render_queue.flush() # healthbars get drawn over them
+        self.profiler.stop('projectiles')
+
+        # Render Healthbars
+        self.profiler.start('healthbars')
+        for entity in [self.player] + visible:
+            healthbar = self.entity_healthbars.get(id(entity))
+            if healthbar and not healthbar.entity.hp <= 0:
+                healthbar.render(self.display, render_scroll)
+        self.profiler.stop('healthbars')
+
+        # Render Particles
+        self.profiler.start('particles')
+        self.particles.render(self.front_layer, offset=render_scroll)
+        self.front_layer.flush()
+        self.profiler.stop('particles')
+
+        self.profiler.start('transition')
+        if self.transition:
+            transition_surf = pygame.Surface(self.display.get_size())
+            pygame.draw.circle(transition_surf, (255, 255, 255), (self.display.get_width() // 2, self.display.get_height() // 2), (30 - abs(self.transition)) * 8)
+            transition_surf.set_colorkey((255, 255, 255)) # makes the circle on the transition_surf transparent
+            self.display.blit(transition_surf, (0, 0))
+
+        self.display_2.blit(self.display, (0, 0))
+        self.profiler.stop('transition')
+
+        if self.show_profiler:
+            self.profiler.render(self.display_2, extra=self.audio.summary)
+
+    def handle_event(self, event):
+        ## Quit Button
+        if event.type == pygame.QUIT:
+            self.running = False
+        if event.type == pygame.KEYDOWN and event.key == pygame.K_F3: # toggle frame time overlay
+            self.show_profiler = not self.show_profiler
+        if event.type == pygame.KEYDOWN: # On key press/hold
+            if event.key in KEYMAP[self.use_wasd]:
+                self.press(KEYMAP[self.use_wasd][event.key])
+
+            if event.key == pygame.K_c: # toggle controls
+                self.use_wasd = not self.use_wasd
+                self.release('left')
+                self.release('right')
+                if self.use_wasd:
+                    print("Controls changed to WASD")
+                else:
+                    print("Controls changed to arrow keys")
+        if event.type == pygame.KEYUP: # On key release
+            if event.key in KEYMAP[self.use_wasd]:
+                self.release(KEYMAP[self.use_wasd][event.key])
+
+    def press(self, action):
+        if self.recorder:
+            self.recorder.press(action)
+
+        if action == 'left': # move left
+            self.movement[0] = True
+
+        if action == 'right': # move right
+            self.movement[1] = True
+
+        if action == 'jump': # jump
+            if self.player.jump():
+                self.sfx['jump'].play()
+
+        if action == 'down': # force down
+            self.player.gravity_vel_change = 0.3
+
+        if action == 'dash': # dash
+            self.player.dash()
+
+    def release(self, action):
+        if self.recorder:
+            self.recorder.release(action)
+
+        if action == 'left': # move left
+            self.movement[0] = False
+
+        if action == 'right': # move right
+            self.movement[1] = False
+
+        if action == 'down': # force down
+            self.player.gravity_vel_change = 0.1
+
+
+if __name__ == "__main__":
+    # python game.py                        -> play
+    # python game.py --record run.nrpl      -> play + record the inputs
+    # python game.py --replay run.nrpl      -> watch a replay (--seek FRAME skips ahead without rendering)
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--record', help='record the inputs to this replay file')
+    parser.add_argument('--replay', help='play back this replay file')
+    parser.add_argument('--seek', type=int, default=0, help='with --replay: fast forward to this frame first')
+    parser.add_argument('--check', action='store_true', help='with --replay: play it headless with and without stray key presses/releases, make sure both end the same')
+    parser.add_argument('--window', type=int, nargs=2, default=(640, 480), metavar=('W', 'H'), help='window size')
+    parser.add_argument('--internal', type=int, nargs=2, default=(320, 240), metavar=('W', 'H'), help='internal (pixel art) resolution')
+    parser.add_argument('--adaptive', action='store_true', help='lower particles/outlines/clouds when frames get slow')
+    parser.add_argument('--profile', metavar='PATH', help='write the per-phase frame timings here when the game quits (.csv or .json)')
+    args = parser.parse_args()
+
+    if args.replay and args.check:
+        game = Game(headless=True)
+        same = check_replay(game, args.replay)
+        game.close()
+        if not same:
+            print('MISMATCH: ' + args.replay + ' plays differently when keys get pressed/released during playback')
+            sys.exit(1)
+        print('ok: ' + args.replay + ' ignores the keyboard')
+        sys.exit(0)
+
+    game = Game(profile_path=args.profile, window_size=tuple(args.window), internal_size=tuple(args.internal), adaptive_quality=args.adaptive)
+    if args.record:
+        Recorder(game, args.record)
+    elif args.replay:
+        Replayer(game, args.replay).seek(args.seek)
+    game.run() # begins running the game
@@ -0,0 +1,48 @@
+### Converts maps between the json format (Tilemap.save) and the compact binary .nmap format
+# python mapconvert.py test0.json test0.nmap
+# python mapconvert.py test0.nmap test0.json
+# python mapconvert.py test0.json test0.nmap --check   -> also makes sure converting back gives the exact same map (tile order too)
+
+import sys
+import json
+import argparse
+
+from scripts.binary_map import BinaryMap, write_map
+
+def read_any(path):
+    if path.endswith('.nmap'):
+        binary_map = BinaryMap(path)
+        map_data = binary_map.to_json()
+        binary_map.close()
+        return map_data
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def same_map(a, b):
+    # exact match, tile order included (Tilemap.extract order = spawn order)
+    return a['tile_size'] == b['tile_size'] and list(a['tilemap'].items()) == list(b['tilemap'].items()) and a['offgrid'] == b['offgrid']
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert maps between .json and .nmap')
+    parser.add_argument('src')
+    parser.add_argument('dst')
+    parser.add_argument('--chunk-size', type=int, default=16, help='chunk size (in tiles) for .nmap output')
+    parser.add_argument('--check', action='store_true', help='read dst back and compare it with src')
+    args = parser.parse_args()
+
+    map_data = read_any(args.src)
+    if args.dst.endswith('.nmap'):
+        write_map(args.dst, map_data, chunk_size=args.chunk_size)
+    else:
+        with open(args.dst, 'w') as f:
+            json.dump(map_data, f)
+
+    if args.check:
+        if not same_map(read_any(args.dst), map_data):
+            print('MISMATCH: ' + args.dst + ' does not match ' + args.src)
+            sys.exit(1)
+        print('ok: ' + args.dst + ' matches ' + args.src)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+### Generates maps (json or .nmap) of any size for load testing
+# python mapgen.py big.json --width 2400                       -> ~100x the tiles of test0.json
+# python mapgen.py huge.nmap --width 30000 --depth 40 --seed 7
+# python mapgen.py small.json --width 120 --enemies 0.1 --check  -> also checks the autotiling against Tilemap.autotile
+# NOTE the map is written one strip of chunks at a time, memory use doesn't grow with --width
+
+import os
+import sys
+import time
+import json
+import argparse
+
+from scripts.mapgen import generate
+
+def check(path):
+    # loads the written map into a real Tilemap, autotiles it again and makes sure nothing changes
+    from scripts.tilemap import Tilemap
+    from mapconvert import read_any
+    map_data = read_any(path)
+    tilemap = Tilemap(None, tile_size=map_data['tile_size'])
+    tilemap.tilemap = json.loads(json.dumps(map_data['tilemap']))
+    tilemap.offgrid_tiles = map_data['offgrid']
+    tilemap.autotile()
+    if tilemap.tilemap != map_data['tilemap']:
+        print('MISMATCH: autotiling ' + path + ' again changes it')
+        sys.exit(1)
+    if not any(tile['type'] == 'spawners' and tile['variant'] == 0 for tile in map_data['tilemap'].values()):
+        print('MISMATCH: ' + path + ' has no player spawner')
+        sys.exit(1)
+    print('ok: ' + path + ' is autotiled and playable')
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a map for load testing (.json or .nmap, by extension)')
+    parser.add_argument('path')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--width', type=int, default=200, help='map width in tiles')
+    parser.add_argument('--depth', type=int, default=16, help='solid tiles below the lowest hill')
+    parser.add_argument('--hills', type=int, default=6, help='max hill height in tiles')
+    parser.add_argument('--hill-width', type=int, default=32, help='tiles between hill tops/valleys')
+    parser.add_argument('--gaps', type=float, default=0.25, help='chance of a gap every 16 columns')
+    parser.add_argument('--platforms', type=float, default=0.35, help='chance of a floating platform every 12 columns')
+    parser.add_argument('--enemies', type=float, default=0.05, help='enemy spawners per column')
+    parser.add_argument('--trees', type=float, default=0.04, help='trees per column')
+    parser.add_argument('--decor', type=float, default=0.2, help='decor per column')
+    parser.add_argument('--bosses', type=int, default=1)
+    parser.add_argument('--chunk-size', type=int, default=16, help='chunk size (in tiles) for .nmap output')
+    parser.add_argument('--check', action='store_true', help='read the map back and check it (loads it fully, small maps only)')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    generator, count = generate(args.path, chunk_size=args.chunk_size, seed=args.seed, width=args.width, depth=args.depth,
+                                hill_height=args.hills, hill_width=args.hill_width, gap_chance=args.gaps, platform_chance=args.platforms,
+                                enemy_density=args.enemies, tree_density=args.trees, decor_density=args.decor, bosses=args.bosses)
+    print(args.path + ': ' + str(count) + ' tiles in ' + str(generator.width) + ' columns, '
+          + str(os.path.getsize(args.path) // 1024) + ' KiB in ' + ('%.2f' % (time.perf_counter() - start)) + 's')
+
+    if args.check:
+        check(args.path)
+
+
+if __name__ == "__main__":
+    main()
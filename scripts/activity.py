@@ -0,0 +1,66 @@
+import pygame
+
+from scripts.spatial import SpatialHash
+
+# Decides which entities get simulated: only the ones near the player are awake, everything else is frozen in place
+# Entities sit in a SpatialHash, so waking up/culling only looks at the cells around the player/camera instead of every entity
+# NOTE wake_radius < sleep_radius, an entity right at the edge doesn't flip between awake and asleep every frame
+# NOTE everything comes back in spawn order, so the same inputs always update the same entities in the same order
+
+class ActivityManager:
+
+    def __init__(self, wake_radius=540, sleep_radius=600, cell_size=128):
+        self.wake_radius = wake_radius # px, entities closer than this to the center wake up
+        self.sleep_radius = sleep_radius # px, awake entities further away than this fall asleep
+        self.entities = SpatialHash(cell_size)
+        self.order = {} # id(entity) -> spawn number
+        self.spawned = 0
+        self.active = [] # awake entities (spawn order)
+
+    def reset(self, entities):
+        self.entities.clear()
+        self.order = {}
+        self.spawned = 0
+        self.active = []
+        for entity in entities:
+            self.add(entity)
+
+    def add(self, entity):
+        # new entities start asleep, the next update() wakes them if they are close enough
+        self.order[id(entity)] = self.spawned
+        self.spawned += 1
+        self.entities.insert(entity, entity.rect())
+
+    def remove(self, entity):
+        self.entities.remove(entity)
+        self.order.pop(id(entity), None)
+        if entity in self.active:
+            self.active.remove(entity)
+
+    def moved(self, entity):
+        # call after an awake entity moved
+        self.entities.move(entity, entity.rect())
+
+    def spawn_order(self, entity):
+        return self.order[id(entity)]
+
+    def update(self, center):
+        # wakes up everything within wake_radius of center, puts the awake ones past sleep_radius to sleep
+        def dist_sq(entity):
+            entity_center = entity.rect().center
+            return (entity_center[0] - center[0]) ** 2 + (entity_center[1] - center[1]) ** 2
+
+        awake = [entity for entity in self.active if dist_sq(entity) <= self.sleep_radius ** 2]
+        awake_ids = set(id(entity) for entity in awake)
+        wake_r = pygame.Rect(center[0] - self.wake_radius, center[1] - self.wake_radius, self.wake_radius * 2, self.wake_radius * 2)
+        for entity in self.entities.query_rect(wake_r):
+            if (id(entity) not in awake_ids) and dist_sq(entity) <= self.wake_radius ** 2:
+                awake.append(entity)
+                awake_ids.add(id(entity))
+        awake.sort(key=self.spawn_order)
+        self.active = awake
+        return self.active
+
+    def visible(self, rect):
+        # entities (awake or not) overlapping rect, e.g. the camera viewport
+        return sorted(self.entities.query_rect(rect), key=self.spawn_order)
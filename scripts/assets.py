@@ -0,0 +1,188 @@
+import os
+import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+import pygame
+
+from scripts.utils import load_image, load_images, Animation
+from scripts.outline import outline_image
+
+# Packs every image of an asset spec into one cached texture atlas (data/.cache/<name>.atlas)
+# First launch loads the images like before (load_image/load_images), applies the transforms, packs them and writes the cache
+# After that startup is a single file read + one convert(), every frame is a subsurface of the atlas
+# NOTE spec format: name -> (kind, path) or (kind, path, options)
+#   kind: 'image' (one img), 'images' (list of imgs), 'animation' (Animation of a list of imgs)
+#   options: 'scale': (w, h), 'flip': (flip_x, flip_y), 'img_dur'/'loop' for animations,
+#            'outline': True -> also adds name + '/outline' with pre-outlined versions of the img(s)
+
+IMG_PATH = 'data/images/'
+CACHE_DIR = 'data/.cache/'
+CACHE_VERSION = 1
+ATLAS_WIDTH = 1024
+PADDING = 1 # black (= transparent) gap between atlas frames
+
+
+def load_sounds(paths):
+    # starts decoding every sound on a thread pool, returns name -> Future (call .result() once the sound is needed)
+    executor = ThreadPoolExecutor(max_workers=min(8, len(paths) or 1))
+    futures = {name: executor.submit(pygame.mixer.Sound, path) for name, path in paths.items()}
+    executor.shutdown(wait=False)
+    return futures
+
+
+class AssetAtlas:
+
+    def __init__(self, name, spec, cache_dir=CACHE_DIR):
+        self.name = name
+        self.spec = spec
+        self.cache_path = os.path.join(cache_dir, name + '.atlas')
+
+    def source_files(self, path):
+        if os.path.isdir(IMG_PATH + path):
+            return [IMG_PATH + path + '/' + img_name for img_name in sorted(os.listdir(IMG_PATH + path))]
+        return [IMG_PATH + path]
+
+    def cache_key(self):
+        # changes whenever the spec or any source image changes
+        key = hashlib.sha1(repr((CACHE_VERSION, sorted(self.spec.items()))).encode('utf-8'))
+        for entry in self.spec.values():
+            for path in self.source_files(entry[1]):
+                stat = os.stat(path)
+                key.update((path + str(stat.st_mtime_ns) + ';' + str(stat.st_size)).encode('utf-8'))
+        return key.hexdigest()
+
+    def load(self):
+        key = self.cache_key()
+        cached = self.read_cache(key)
+        if cached:
+            index, atlas, outline_atlas = cached
+        else:
+            index, atlas, outline_atlas = self.build()
+            self.write_cache(key, index, atlas, outline_atlas)
+        return self.make_assets(index, atlas.convert(), outline_atlas.convert_alpha() if outline_atlas else None)
+
+    def source_frames(self, entry):
+        kind, path = entry[0], entry[1]
+        options = entry[2] if len(entry) > 2 else {}
+        frames = [load_image(path)] if kind == 'image' else load_images(path)
+        if 'scale' in options:
+            frames = [pygame.transform.scale(img, options['scale']) for img in frames]
+        if 'flip' in options:
+            frames = [pygame.transform.flip(img, options['flip'][0], options['flip'][1]) for img in frames]
+        return frames
+
+    def pack(self, sizes):
+        # simple shelf packing (tallest first), returns one rect per size + the atlas size
+        order = sorted(range(len(sizes)), key=lambda i: -sizes[i][1])
+        rects = [None] * len(sizes)
+        x, y, shelf_height, width = 0, 0, 0, 1
+        for i in order:
+            w, h = sizes[i]
+            if x and x + w > ATLAS_WIDTH:
+                x, y, shelf_height = 0, y + shelf_height + PADDING, 0
+            rects[i] = [x, y, w, h]
+            x += w + PADDING
+            shelf_height = max(shelf_height, h)
+            width = max(width, x)
+        return rects, (width, max(1, y + shelf_height))
+
+    def build(self):
+        frames = [] # every frame of every entry
+        outline_frames = []
+        index = {} # name -> {'frames': [frame indices], 'outlines': [outline frame indices]}
+        for name, entry in self.spec.items():
+            options = entry[2] if len(entry) > 2 else {}
+            entry_frames = self.source_frames(entry)
+            index[name] = {'frames': list(range(len(frames), len(frames) + len(entry_frames)))}
+            frames += entry_frames
+            if options.get('outline'):
+                index[name]['outlines'] = list(range(len(outline_frames), len(outline_frames) + len(entry_frames)))
+                outline_frames += [outline_image(img) for img in entry_frames]
+
+        rects, size = self.pack([img.get_size() for img in frames])
+        atlas = pygame.Surface(size)
+        atlas.fill((0, 0, 0))
+        for img, rect in zip(frames, rects):
+            atlas.blit(img, rect[:2])
+
+        outline_atlas = None
+        outline_rects = []
+        if outline_frames:
+            outline_rects, outline_size = self.pack([img.get_size() for img in outline_frames])
+            outline_atlas = pygame.Surface(outline_size, pygame.SRCALPHA)
+            for img, rect in zip(outline_frames, outline_rects):
+                outline_atlas.blit(img, rect[:2])
+
+        return {'entries': index, 'rects': rects, 'outline_rects': outline_rects}, atlas, outline_atlas
+
+    def make_assets(self, index, atlas, outline_atlas):
+        atlas.set_colorkey((0, 0, 0)) # subsurfaces inherit the colorkey (same as load_image)
+        frames = [atlas.subsurface(rect) for rect in index['rects']]
+        outline_frames = [outline_atlas.subsurface(rect) for rect in index['outline_rects']] if outline_atlas else []
+
+        assets = {}
+        for name, entry in self.spec.items():
+            kind = entry[0]
+            options = entry[2] if len(entry) > 2 else {}
+            variants = [('', [frames[i] for i in index['entries'][name]['frames']])]
+            if 'outlines' in index['entries'][name]:
+                variants.append(('/outline', [outline_frames[i] for i in index['entries'][name]['outlines']]))
+            for suffix, imgs in variants:
+                if kind == 'image':
+                    assets[name + suffix] = imgs[0]
+                elif kind == 'animation':
+                    assets[name + suffix] = Animation(imgs, img_dur=options.get('img_dur', 5), loop=options.get('loop', True))
+                else:
+                    assets[name + suffix] = imgs
+        return assets
+
+    def read_cache(self, key):
+        # cache file = 4 byte header length + json header + raw RGB atlas + raw RGBA outline atlas, read in one go
+        try:
+            with open(self.cache_path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+
+        try:
+            return self.parse_cache(data, key)
+        except (ValueError, KeyError, TypeError, pygame.error): # truncated/corrupt file (ValueError covers bad json too), rebuild it
+            return None
+
+    def parse_cache(self, data, key):
+        header_len = int.from_bytes(data[:4], 'little')
+        header = json.loads(data[4:4 + header_len].decode('utf-8'))
+        if header['key'] != key:
+            return None
+
+        offset = 4 + header_len
+        size = tuple(header['size'])
+        atlas = pygame.image.frombytes(data[offset:offset + size[0] * size[1] * 3], size, 'RGB')
+        offset += size[0] * size[1] * 3
+
+        outline_atlas = None
+        if header['outline_size']:
+            outline_size = tuple(header['outline_size'])
+            outline_atlas = pygame.image.frombytes(data[offset:offset + outline_size[0] * outline_size[1] * 4], outline_size, 'RGBA')
+        return header['index'], atlas, outline_atlas
+
+    def write_cache(self, key, index, atlas, outline_atlas):
+        header = json.dumps({
+            'key': key,
+            'index': index,
+            'size': atlas.get_size(),
+            'outline_size': outline_atlas.get_size() if outline_atlas else None,
+        }).encode('utf-8')
+        tmp_path = self.cache_path + '.' + str(os.getpid()) + '.tmp' # several processes (batch.py workers) can build the cache at once
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                f.write(len(header).to_bytes(4, 'little'))
+                f.write(header)
+                f.write(pygame.image.tobytes(atlas, 'RGB'))
+                if outline_atlas:
+                    f.write(pygame.image.tobytes(outline_atlas, 'RGBA'))
+            os.replace(tmp_path, self.cache_path)
+        except OSError:
+            pass # no cache this time, the atlas still works
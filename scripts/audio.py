@@ -0,0 +1,162 @@
+import math
+import queue
+import threading
+
+import pygame
+
+# Sound effects go through here instead of straight to the mixer
+# NOTE gameplay code (and the entities) keep calling self.sfx[name].play(), self.sfx holds SoundProxy objects that turn that into a request
+# NOTE all requests of one frame get deduplicated (one play per sound per frame, the loudest one wins) and handed to a worker thread
+#      in one batch by end_frame(), the worker picks the channels, so the game loop never touches the mixer
+# NOTE channels: every sound has a voice limit (past it, its oldest voice gets restarted) and a priority (when every channel is busy,
+#      a sound can take the channel of the oldest lower priority one, otherwise it's dropped), so big fights can't drown out hits/deaths
+
+# name -> (priority, voice limit)
+SOUND_SETTINGS = {
+    'ambience': (4, 1),
+    'death': (3, 1),
+    'hit': (3, 2),
+    'jump': (2, 1),
+    'dash': (2, 1),
+    'slash1': (2, 2),
+    'slash2': (2, 2),
+    'slash3': (2, 2),
+    'shoot1': (1, 4),
+    'shoot2': (1, 4),
+}
+DEFAULT_SETTINGS = (1, 2)
+
+
+class SoundProxy:
+    # stands in for a pygame Sound in game.sfx, play() goes through the AudioManager, everything else (set_volume, ...) to the Sound
+
+    def __init__(self, audio, name, sound):
+        self.audio = audio
+        self.name = name
+        self.sound = sound
+
+    def play(self, loops=0, maxtime=0, fade_ms=0):
+        self.audio.play(self.name, loops=loops, maxtime=maxtime, fade_ms=fade_ms)
+
+    def stop(self):
+        self.audio.stop(self.name)
+
+    def __getattr__(self, name):
+        if name.startswith('__'): # copy/pickle probing, don't end up in an endless self.sound lookup
+            raise AttributeError(name)
+        return getattr(self.sound, name)
+
+
+class AudioManager:
+
+    def __init__(self, sounds, channels=32, hearing_range=400):
+        self.sounds = sounds # name -> pygame Sound
+        self.hearing_range = hearing_range # px, sounds further away than this from the camera center are silent
+        self.listener = None # camera center (world px), None = no attenuation
+        self.emitter = None # position of whatever is making sounds right now (e.g. the enemy being updated), None = at the listener
+        self.muted = not pygame.mixer.get_init() # no sound device, nothing to do
+        self.pending = {} # name -> (volume, pan, (loops, maxtime, fade_ms)), this frame's requests
+        self.stats = {'requested': 0, 'merged': 0, 'silent': 0, 'dropped': 0, 'stolen': 0}
+
+        self.channels = []
+        if not self.muted:
+            pygame.mixer.set_num_channels(channels)
+            self.channels = [pygame.mixer.Channel(i) for i in range(channels)]
+        self.playing = [None] * len(self.channels) # channel index -> (name, priority, order started), worker thread only
+        self.started = 0
+
+        self.queue = queue.Queue()
+        self.worker = threading.Thread(target=self.work, daemon=True)
+        self.worker.start()
+
+    def proxies(self):
+        # what goes into game.sfx
+        return {name: SoundProxy(self, name, sound) for name, sound in self.sounds.items()}
+
+    def attenuate(self, pos):
+        # volume (0-1) and pan (-1 left, 1 right) of a sound at pos
+        if pos is None or self.listener is None:
+            return 1, 0
+        dx = pos[0] - self.listener[0]
+        dy = pos[1] - self.listener[1]
+        volume = max(0, 1 - math.sqrt(dx * dx + dy * dy) / self.hearing_range)
+        return volume, max(-1, min(1, dx / self.hearing_range))
+
+    def play(self, name, pos=None, loops=0, maxtime=0, fade_ms=0):
+        # loops/maxtime/fade_ms work like in Sound.play
+        if self.muted:
+            return
+        self.stats['requested'] += 1
+        volume, pan = self.attenuate(self.emitter if pos is None else pos)
+        if volume <= 0:
+            self.stats['silent'] += 1
+            return
+        if name in self.pending:
+            self.stats['merged'] += 1
+            if self.pending[name][0] >= volume:
+                return
+        self.pending[name] = (volume, pan, (loops, maxtime, fade_ms))
+
+    def stop(self, name):
+        self.queue.put(('stop', name))
+
+    def end_frame(self, listener=None):
+        # call once per frame, listener = camera center for the next frame's attenuation
+        if self.pending:
+            self.queue.put(('play', self.pending))
+            self.pending = {}
+        if listener is not None:
+            self.listener = listener
+
+    def summary(self):
+        # lines for the F3 overlay
+        stats = self.stats
+        return ['sfx ' + str(stats['requested']) + ' asked  ' + str(stats['merged']) + ' merged  ' + str(stats['silent']) + ' too far',
+                'sfx ' + str(stats['dropped']) + ' dropped  ' + str(stats['stolen']) + ' stolen  ' + str(sum(1 for playing in self.playing if playing)) + '/' + str(len(self.channels)) + ' ch']
+
+    def close(self):
+        self.queue.put(('quit', None))
+        self.worker.join()
+
+    def work(self):
+        while True:
+            task, data = self.queue.get()
+            if task == 'play':
+                for name, (volume, pan, play_args) in data.items():
+                    self.start(name, volume, pan, play_args)
+            elif task == 'stop':
+                for i, playing in enumerate(self.playing):
+                    if playing and playing[0] == data:
+                        self.channels[i].stop()
+                        self.playing[i] = None
+            elif task == 'quit':
+                break
+
+    def pick_channel(self, name, priority, limit):
+        # index of the channel to play on, None = drop the sound
+        for i, channel in enumerate(self.channels):
+            if self.playing[i] and not channel.get_busy():
+                self.playing[i] = None
+        voices = [i for i, playing in enumerate(self.playing) if playing and playing[0] == name]
+        if len(voices) >= limit:
+            return min(voices, key=lambda i: self.playing[i][2])
+        for i, playing in enumerate(self.playing):
+            if not playing:
+                return i
+        lower = [i for i, playing in enumerate(self.playing) if playing[1] < priority]
+        if not lower:
+            return None
+        self.stats['stolen'] += 1
+        return min(lower, key=lambda i: (self.playing[i][1], self.playing[i][2]))
+
+    def start(self, name, volume, pan, play_args):
+        priority, limit = SOUND_SETTINGS.get(name, DEFAULT_SETTINGS)
+        i = self.pick_channel(name, priority, limit)
+        if i is None:
+            self.stats['dropped'] += 1
+            return
+        channel = self.channels[i]
+        channel.play(self.sounds[name], *play_args)
+        channel.set_volume(volume * min(1, 1 - pan), volume * min(1, 1 + pan))
+        self.started += 1
+        self.playing[i] = (name, priority, self.started)
@@ -0,0 +1,72 @@
+from scripts.tilemap import AUTOTILE_MAP, AUTOTILE_TYPES
+
+# Incremental autotiling: only the cells that changed (and their neighbours) get their variant re-resolved
+# AUTOTILE_MAP is turned into a 16 entry lookup table indexed by a 4 bit neighbour mask (same type on the right/left/up/down)
+# NOTE changed tiles get replaced by a new dict instead of being edited in place, so snapshots of the tilemap (undo, autosave) stay valid
+
+NEIGHBOR_BITS = [((1, 0), 1), ((-1, 0), 2), ((0, -1), 4), ((0, 1), 8)]
+
+def build_lut():
+    lut = [None] * 16 # neighbour mask -> variant (None = AUTOTILE_MAP has no rule for it, leave the variant alone)
+    for neighbors, variant in AUTOTILE_MAP.items():
+        mask = 0
+        for shift, bit in NEIGHBOR_BITS:
+            if shift in neighbors:
+                mask |= bit
+        lut[mask] = variant
+    return lut
+
+AUTOTILE_LUT = build_lut()
+
+
+class Autotiler:
+
+    def __init__(self, tilemap):
+        self.tilemap = tilemap
+        self.dirty = set() # tile positions that were placed/deleted since the last flush()
+
+    def mark(self, tile_pos):
+        self.dirty.add((int(tile_pos[0]), int(tile_pos[1])))
+
+    def resolve(self, tile_pos):
+        # returns the old tile if the variant of the tile at tile_pos changed (None otherwise)
+        tiles = self.tilemap.tilemap
+        tile_loc = str(tile_pos[0]) + ';' + str(tile_pos[1])
+        tile = tiles.get(tile_loc)
+        if (not tile) or (tile['type'] not in AUTOTILE_TYPES):
+            return None
+        mask = 0
+        for shift, bit in NEIGHBOR_BITS:
+            neighbor = tiles.get(str(tile_pos[0] + shift[0]) + ';' + str(tile_pos[1] + shift[1]))
+            if neighbor and neighbor['type'] == tile['type']:
+                mask |= bit
+        variant = AUTOTILE_LUT[mask]
+        if (variant is not None) and (variant != tile['variant']):
+            tiles[tile_loc] = {'type': tile['type'], 'variant': variant, 'pos': tile['pos']}
+            return tile
+        return None
+
+    def flush(self):
+        # re-resolves the dirty cells + their neighbours, returns (tile_pos, old tile) for every tile whose variant changed
+        cells = set(self.dirty)
+        for tile_pos in self.dirty:
+            for shift, bit in NEIGHBOR_BITS:
+                cells.add((tile_pos[0] + shift[0], tile_pos[1] + shift[1]))
+        self.dirty.clear()
+        changed = []
+        for tile_pos in cells:
+            old_tile = self.resolve(tile_pos)
+            if old_tile:
+                changed.append((tile_pos, old_tile))
+        return changed
+
+    def autotile_all(self):
+        # same result as Tilemap.autotile, but reports what changed like flush()
+        self.dirty.clear()
+        changed = []
+        for tile_loc in list(self.tilemap.tilemap):
+            tile_pos = self.tilemap.tilemap[tile_loc]['pos']
+            old_tile = self.resolve((int(tile_pos[0]), int(tile_pos[1])))
+            if old_tile:
+                changed.append(((int(tile_pos[0]), int(tile_pos[1])), old_tile))
+        return changed
@@ -0,0 +1,233 @@
+import mmap
+import struct
+
+# Compact binary map format (.nmap), converts losslessly to/from the json format from Tilemap.save
+# NOTE layout (little endian):
+#   header
+#   chunk data      -> per grid tile: x (int16), y (int16), palette index (uint16), grouped by chunk
+#   pinned tiles    -> grid tiles that are always loaded (spawners, large_decor), same record as chunk data
+#   offgrid tiles   -> x (float64), y (float64), flags (uint8, bit 0/1 = x/y was an int), palette index (uint16)
+#   palette         -> per entry: type length (uint8), type (utf-8), variant (uint16)
+#   chunk index     -> per chunk: chunk_x (int16), chunk_y (int16), offset (uint32), tile count (uint32)
+#   order table     -> per grid tile record (chunk data in index order, then pinned): its position in the source tilemap (uint32)
+# Only the header/palette/index get parsed on open, chunk data is read straight out of the mmap when it's needed
+# NOTE tile order matters: Tilemap.extract hands out spawners in tilemap/offgrid order, which decides enemy spawn (and update) order.
+#      Pinned tiles and offgrid tiles are stored in source order (so a streamed map spawns like the json one), to_json uses the order table
+
+MAGIC = b'NMAP'
+VERSION = 1
+
+HEADER = struct.Struct('<4sHHHHIIIIIIII') # magic, version, tile_size, chunk_size, palette count, chunk count, pinned count, offgrid count, then the offsets of: pinned, offgrid, palette, index, order table
+TILE = struct.Struct('<hhH')
+OFFGRID = struct.Struct('<ddBH')
+PALETTE_VARIANT = struct.Struct('<H')
+INDEX = struct.Struct('<hhII')
+ORDER = struct.Struct('<I')
+
+PINNED_TYPES = {'spawners', 'large_decor'} # needed by load_level (spawners, leaf spawners) no matter where the camera is
+
+
+class MapWriter:
+    # writes a .nmap chunk by chunk, so a map never has to be fully in memory (only the palette/index/offgrid are kept)
+
+    def __init__(self, path, tile_size=16, chunk_size=16):
+        self.tile_size = tile_size
+        self.chunk_size = chunk_size
+        self.palette = {} # (type, variant) -> index
+        self.index = [] # (chunk_x, chunk_y, offset, count)
+        self.pinned = [] # (source order, packed tile)
+        self.offgrid = []
+        self.order = [] # source order of every chunk data record, in file order
+        self.tile_count = 0
+
+        self.f = open(path, 'wb')
+        self.f.write(bytes(HEADER.size)) # real header is written by close()
+
+    def palette_index(self, tile):
+        key = (tile['type'], tile['variant'])
+        if key not in self.palette:
+            self.palette[key] = len(self.palette)
+        return self.palette[key]
+
+    def pack_tile(self, tile):
+        pos = tile['pos']
+        if not (-32768 <= pos[0] <= 32767 and -32768 <= pos[1] <= 32767):
+            raise ValueError('tile position out of int16 range: ' + str(pos))
+        return TILE.pack(pos[0], pos[1], self.palette_index(tile))
+
+    def add_chunk(self, chunk_loc, tiles, order=None):
+        # tiles = grid tiles (json format) that are inside chunk_loc, pinned types get pulled out automatically
+        # order = where each tile sits in the source tilemap (None = in the order they're added)
+        if order is None:
+            order = range(self.tile_count, self.tile_count + len(tiles))
+        self.tile_count += len(tiles)
+        data = []
+        for tile, index in zip(tiles, order):
+            if tile['type'] in PINNED_TYPES:
+                self.pinned.append((index, self.pack_tile(tile)))
+            else:
+                data.append(self.pack_tile(tile))
+                self.order.append(index)
+        if data:
+            self.index.append((chunk_loc[0], chunk_loc[1], self.f.tell(), len(data)))
+            self.f.write(b''.join(data))
+
+    def add_offgrid(self, tile):
+        flags = (1 if isinstance(tile['pos'][0], int) else 0) | (2 if isinstance(tile['pos'][1], int) else 0)
+        self.offgrid.append(OFFGRID.pack(tile['pos'][0], tile['pos'][1], flags, self.palette_index(tile)))
+
+    def close(self):
+        self.pinned.sort(key=lambda pinned: pinned[0])
+        pinned_offset = self.f.tell()
+        self.f.write(b''.join(packed for index, packed in self.pinned))
+
+        offgrid_offset = self.f.tell()
+        self.f.write(b''.join(self.offgrid))
+
+        palette_offset = self.f.tell()
+        for (tile_type, variant) in sorted(self.palette, key=self.palette.get):
+            name = tile_type.encode('utf-8')
+            self.f.write(bytes([len(name)]) + name + PALETTE_VARIANT.pack(variant))
+
+        index_offset = self.f.tell()
+        for entry in self.index:
+            self.f.write(INDEX.pack(*entry))
+
+        order_offset = self.f.tell()
+        self.f.write(b''.join(ORDER.pack(index) for index in self.order + [pinned[0] for pinned in self.pinned]))
+
+        self.f.seek(0)
+        self.f.write(HEADER.pack(MAGIC, VERSION, self.tile_size, self.chunk_size, len(self.palette), len(self.index), len(self.pinned), len(self.offgrid), pinned_offset, offgrid_offset, palette_offset, index_offset, order_offset))
+        self.f.close()
+
+
+def write_map(path, map_data, chunk_size=16):
+    # map_data = json format: {'tilemap': {...}, 'tile_size': 16, 'offgrid': [...]}
+    chunks = {} # chunk_loc -> (tiles, their index in the source tilemap)
+    for index, tile in enumerate(map_data['tilemap'].values()):
+        chunk = chunks.setdefault((tile['pos'][0] // chunk_size, tile['pos'][1] // chunk_size), ([], []))
+        chunk[0].append(tile)
+        chunk[1].append(index)
+
+    writer = MapWriter(path, tile_size=map_data['tile_size'], chunk_size=chunk_size)
+    for chunk_loc in sorted(chunks):
+        writer.add_chunk(chunk_loc, *chunks[chunk_loc])
+    for tile in map_data['offgrid']:
+        writer.add_offgrid(tile)
+    writer.close()
+
+
+class BinaryMap:
+
+    def __init__(self, path):
+        self.f = open(path, 'rb')
+        self.data = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.tile_size, self.chunk_size, palette_count, chunk_count, self.pinned_count, self.offgrid_count, self.pinned_offset, self.offgrid_offset, palette_offset, index_offset, self.order_offset = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC:
+            raise ValueError(path + ' is not a .nmap file')
+        if version != VERSION:
+            raise ValueError(path + ' has unsupported .nmap version ' + str(version))
+
+        self.palette = []
+        offset = palette_offset
+        for i in range(palette_count):
+            length = self.data[offset]
+            tile_type = self.data[offset + 1:offset + 1 + length].decode('utf-8')
+            variant = PALETTE_VARIANT.unpack_from(self.data, offset + 1 + length)[0]
+            self.palette.append((tile_type, variant))
+            offset += 1 + length + PALETTE_VARIANT.size
+
+        self.index = {} # chunk_loc -> (offset, count)
+        for chunk_x, chunk_y, chunk_offset, count in INDEX.iter_unpack(self.data[index_offset:index_offset + chunk_count * INDEX.size]):
+            self.index[(chunk_x, chunk_y)] = (chunk_offset, count)
+
+    def close(self):
+        self.data.close()
+        self.f.close()
+
+    def read_records(self, offset, count):
+        # (key, tile) in file order
+        records = []
+        palette = self.palette
+        for x, y, palette_index in TILE.iter_unpack(self.data[offset:offset + count * TILE.size]):
+            tile_type, variant = palette[palette_index]
+            records.append((str(x) + ';' + str(y), {'type': tile_type, 'variant': variant, 'pos': [x, y]}))
+        return records
+
+    def read_tiles(self, offset, count):
+        return dict(self.read_records(offset, count))
+
+    def read_offgrid(self):
+        offgrid = []
+        data = self.data[self.offgrid_offset:self.offgrid_offset + self.offgrid_count * OFFGRID.size]
+        for x, y, flags, palette_index in OFFGRID.iter_unpack(data):
+            tile_type, variant = self.palette[palette_index]
+            offgrid.append({'type': tile_type, 'variant': variant, 'pos': [int(x) if flags & 1 else x, int(y) if flags & 2 else y]})
+        return offgrid
+
+    def load_static(self, tilemap):
+        # replaces the tilemap with only the always-loaded stuff (pinned grid tiles + offgrid tiles), chunks come later
+        tilemap.tile_size = self.tile_size
+        tilemap.tilemap = self.read_tiles(self.pinned_offset, self.pinned_count)
+        tilemap.offgrid_tiles = self.read_offgrid()
+
+    def load_chunk(self, tilemap, chunk_loc):
+        # returns the tiles that got added (empty if the chunk has none)
+        if chunk_loc not in self.index:
+            return {}
+        tiles = self.read_tiles(*self.index[chunk_loc])
+        tilemap.tilemap.update(tiles)
+        return tiles
+
+    def load_all(self, tilemap):
+        self.load_static(tilemap)
+        for chunk_loc in self.index:
+            self.load_chunk(tilemap, chunk_loc)
+
+    def to_json(self):
+        # map_data in the Tilemap.save format
+        records = []
+        for offset, count in self.index.values():
+            records += self.read_records(offset, count)
+        records += self.read_records(self.pinned_offset, self.pinned_count)
+        ordered = [None] * len(records) # back into the order of the map it was made from
+        for record, (index,) in zip(records, ORDER.iter_unpack(self.data[self.order_offset:self.order_offset + len(records) * ORDER.size])):
+            ordered[index] = record
+        records = ordered
+        return {'tilemap': dict(records), 'tile_size': self.tile_size, 'offgrid': self.read_offgrid()}
+
+
+class MapStreamer:
+    # keeps the chunks around a position loaded into a tilemap (chunks are never unloaded again)
+
+    def __init__(self, binary_map, tilemap, radius=3):
+        self.map = binary_map
+        self.tilemap = tilemap
+        self.radius = radius # in chunks
+        self.loaded = set()
+        self.last_center = None
+
+        self.map.load_static(self.tilemap)
+
+    def chunk_px(self):
+        return self.map.chunk_size * self.map.tile_size
+
+    def load_around(self, pos, radius=None):
+        # returns chunk_loc -> tiles of the newly loaded chunks (only the ones that actually had tiles)
+        radius = self.radius if radius is None else radius
+        center = (int(pos[0] // self.chunk_px()), int(pos[1] // self.chunk_px()))
+        if (center, radius) == self.last_center: # nothing new to load until pos moves into another chunk
+            return {}
+        self.last_center = (center, radius)
+        new_chunks = {}
+        for chunk_x in range(center[0] - radius, center[0] + radius + 1):
+            for chunk_y in range(center[1] - radius, center[1] + radius + 1):
+                chunk_loc = (chunk_x, chunk_y)
+                if chunk_loc not in self.loaded:
+                    self.loaded.add(chunk_loc)
+                    tiles = self.map.load_chunk(self.tilemap, chunk_loc)
+                    if tiles:
+                        new_chunks[chunk_loc] = tiles
+        return new_chunks
+
@@ -0,0 +1,41 @@
+# Lowers the visual quality when frames get close to the frame budget (and raises it again once there is room)
+# NOTE only visual things change here, the simulation is the same at every level
+
+QUALITY_LEVELS = [
+    {'particles': 1.0, 'outline': True, 'clouds': 1.0},
+    {'particles': 0.5, 'outline': True, 'clouds': 0.5},
+    {'particles': 0.25, 'outline': False, 'clouds': 0.25},
+    {'particles': 0.1, 'outline': False, 'clouds': 0.0},
+]
+
+class QualityGovernor:
+
+    def __init__(self, budget_ms, levels=QUALITY_LEVELS, high=0.9, low=0.6, patience=30):
+        self.budget_ms = budget_ms # time one frame is allowed to take (e.g. 1000 / 60)
+        self.levels = levels
+        self.high = high # above high * budget (on average) -> lower the quality
+        self.low = low # below low * budget -> raise it again
+        self.patience = patience # frames in a row it has to be too slow/fast before anything changes
+        self.level = 0
+        self.average = 0
+        self.slow_frames = 0
+        self.fast_frames = 0
+
+    def settings(self):
+        return self.levels[self.level]
+
+    def record(self, frame_ms):
+        # frame_ms = time spent working on the frame (not sleeping), returns True if the level changed
+        self.average += (frame_ms - self.average) * 0.1
+        self.slow_frames = self.slow_frames + 1 if self.average > self.budget_ms * self.high else 0
+        self.fast_frames = self.fast_frames + 1 if self.average < self.budget_ms * self.low else 0
+
+        if self.slow_frames >= self.patience and self.level < len(self.levels) - 1:
+            self.level += 1
+        elif self.fast_frames >= self.patience * 4 and self.level > 0: # slower to come back up, so it doesn't flip back and forth
+            self.level -= 1
+        else:
+            return False
+        self.slow_frames = 0
+        self.fast_frames = 0
+        return True
@@ -0,0 +1,271 @@
+import os
+import json
+import queue
+import threading
+from collections import deque
+
+# Undo/redo for the editor + a crash-safe autosave journal
+# NOTE a change is one of:
+#   ('grid', tile_loc, old tile, new tile)   -> tile = tile dict or None (= no tile there)
+#   ('offgrid', tile, added, index)          -> offgrid tile dict that got added (True) or removed (False) at that index of offgrid_tiles
+# NOTE tile dicts are never edited in place (placing/autotiling always puts a new dict in), so changes can just keep references
+
+class EditHistory:
+
+    def __init__(self, tilemap, limit=200, autosave=None):
+        self.tilemap = tilemap
+        self.undo_stack = deque(maxlen=limit) # oldest strokes fall off the end, memory stays bounded
+        self.redo_stack = []
+        self.autosave = autosave # Autosave that gets every change that actually hits the map (optional)
+
+        self.stroke = None # changes of the stroke in progress
+        self.stroke_grid = {} # tile_loc -> index in self.stroke (a drag only keeps one change per tile)
+
+    def begin(self):
+        # everything recorded until end() becomes one undo step (e.g. a mouse drag)
+        if self.stroke is None:
+            self.stroke = []
+            self.stroke_grid = {}
+
+    def end(self):
+        if self.stroke is None:
+            return
+        changes = [change for change in self.stroke if change is not None]
+        self.stroke = None
+        if changes:
+            self.undo_stack.append(changes)
+            self.redo_stack = []
+            if self.autosave:
+                self.autosave.append(changes)
+
+    def record_grid(self, tile_pos, old_tile, new_tile):
+        tile_loc = str(tile_pos[0]) + ';' + str(tile_pos[1])
+        single = self.stroke is None
+        self.begin()
+        if tile_loc in self.stroke_grid: # coalesce: keep the first old tile, take the latest new one
+            i = self.stroke_grid[tile_loc]
+            old_tile = self.stroke[i][2]
+            self.stroke[i] = None if old_tile == new_tile else ('grid', tile_loc, old_tile, new_tile)
+            if self.stroke[i] is None:
+                del self.stroke_grid[tile_loc]
+        else:
+            self.stroke_grid[tile_loc] = len(self.stroke)
+            self.stroke.append(('grid', tile_loc, old_tile, new_tile))
+        if single:
+            self.end()
+
+    def record_offgrid(self, tile, added, index):
+        # index = where the tile was inserted/removed, at the time it happened (removals in a batch count the earlier ones as gone already)
+        single = self.stroke is None
+        self.begin()
+        self.stroke.append(('offgrid', tile, added, index))
+        if single:
+            self.end()
+
+    def apply(self, changes, reverse=False):
+        # applies changes to the tilemap (or undoes them), returns the changes that were applied (in the forward direction)
+        applied = []
+        offgrid_tiles = self.tilemap.offgrid_tiles
+        for change in (reversed(changes) if reverse else changes):
+            if change[0] == 'grid':
+                tile_loc, old_tile, new_tile = change[1], change[2], change[3]
+                if reverse:
+                    old_tile, new_tile = new_tile, old_tile
+                if new_tile is None:
+                    self.tilemap.tilemap.pop(tile_loc, None)
+                else:
+                    self.tilemap.tilemap[tile_loc] = new_tile
+                applied.append(('grid', tile_loc, old_tile, new_tile))
+            else:
+                tile, added, index = change[1], change[2] != reverse, change[3]
+                if added:
+                    offgrid_tiles.insert(index, tile)
+                else:
+                    if not (index < len(offgrid_tiles) and offgrid_tiles[index] is tile): # shouldn't happen, but don't delete the wrong tile
+                        index = next(i for i, other in enumerate(offgrid_tiles) if other is tile)
+                    del offgrid_tiles[index]
+                applied.append(('offgrid', tile, added, index))
+        if self.autosave and applied:
+            self.autosave.append(applied)
+        return applied
+
+    def undo(self):
+        self.end()
+        if not self.undo_stack:
+            return []
+        changes = self.undo_stack.pop()
+        self.redo_stack.append(changes)
+        return self.apply(changes, reverse=True)
+
+    def redo(self):
+        self.end()
+        if not self.redo_stack:
+            return []
+        changes = self.redo_stack.pop()
+        self.undo_stack.append(changes)
+        return self.apply(changes)
+
+
+def tile_json(tile):
+    return {'type': tile['type'], 'variant': tile['variant'], 'pos': list(tile['pos'])}
+
+def write_snapshot(path, tilemap, tile_size, offgrid, extra=None):
+    # same format as Tilemap.save, but written one tile at a time so the thread doing it never holds the GIL for long
+    # NOTE written to a temp file first, a crash halfway through never leaves a broken snapshot behind
+    with open(path + '.tmp', 'w') as f:
+        f.write('{"tilemap": {')
+        for i, (tile_loc, tile) in enumerate(tilemap.items()):
+            f.write((', ' if i else '') + json.dumps(tile_loc) + ': ' + json.dumps(tile_json(tile)))
+        f.write('}, "tile_size": ' + json.dumps(tile_size) + ', "offgrid": [')
+        for i, tile in enumerate(offgrid):
+            f.write((', ' if i else '') + json.dumps(tile_json(tile)))
+        f.write(']')
+        for key, value in (extra or {}).items():
+            f.write(', ' + json.dumps(key) + ': ' + json.dumps(value))
+        f.write('}')
+    os.replace(path + '.tmp', path)
+
+
+class Autosave:
+    # appends every change to <path>.journal and every compact_every changes rewrites <path>.json as a full snapshot
+    # all the file writing happens on a worker thread, the editor only puts things in a queue
+    # NOTE every journal line has a sequence number, the snapshot remembers the last one it contains
+
+    def __init__(self, tilemap, path='autosave', source=None, compact_every=500):
+        self.tilemap = tilemap
+        self.snapshot_path = path + '.json'
+        self.journal_path = path + '.journal'
+        self.source = source # map the autosave belongs to (recover() ignores autosaves of other maps)
+        self.foreign = False # the autosave on disk belongs to another map, leave its files alone (nothing gets journaled or cleared)
+        self.compact_every = compact_every
+        self.seq = 0
+        self.since_compact = 0
+
+        self.queue = queue.Queue()
+        self.worker = threading.Thread(target=self.work, daemon=True)
+        self.worker.start()
+
+    def exists(self):
+        return os.path.exists(self.snapshot_path) or os.path.exists(self.journal_path)
+
+    def recover(self):
+        # loads snapshot + journal into the tilemap, returns False if there was nothing (for this map) to recover
+        # (self.foreign tells if that's because the autosave is another map's)
+        # NOTE call this before any edits happen
+        if not self.exists():
+            return False
+        snapshot_seq = 0
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, 'r') as f:
+                map_data = json.load(f)
+            if map_data.get('source') != self.source:
+                self.foreign = True
+                return False
+            self.tilemap.tilemap = map_data['tilemap']
+            self.tilemap.tile_size = map_data['tile_size']
+            self.tilemap.offgrid_tiles = map_data['offgrid']
+            snapshot_seq = map_data.get('journal_seq', 0)
+
+        self.seq = snapshot_seq
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, 'r') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError: # half written last line from a crash
+                        break
+                    if entry['source'] != self.source:
+                        self.foreign = True
+                        return False
+                    if entry['seq'] > snapshot_seq:
+                        self.replay(entry['changes'])
+                        self.seq = entry['seq']
+        return True
+
+    def replay(self, changes):
+        for change in changes:
+            if change[0] == 'g':
+                if change[2] is None:
+                    self.tilemap.tilemap.pop(change[1], None)
+                else:
+                    self.tilemap.tilemap[change[1]] = change[2]
+            elif change[0] == 'o+':
+                self.tilemap.offgrid_tiles.insert(change[2], change[1])
+            else:
+                offgrid_tiles = self.tilemap.offgrid_tiles
+                index = change[2]
+                if not (index < len(offgrid_tiles) and tile_json(offgrid_tiles[index]) == change[1]):
+                    index = next((i for i, tile in enumerate(offgrid_tiles) if tile_json(tile) == change[1]), None)
+                if index is not None:
+                    del offgrid_tiles[index]
+
+    def append(self, changes):
+        if self.foreign:
+            return
+        self.seq += 1
+        lines = []
+        for change in changes:
+            if change[0] == 'grid':
+                lines.append(['g', change[1], tile_json(change[3]) if change[3] else None])
+            else:
+                lines.append(['o+' if change[2] else 'o-', tile_json(change[1]), change[3]])
+        self.queue.put(('append', {'seq': self.seq, 'source': self.source, 'changes': lines}))
+        self.since_compact += len(changes)
+        if self.since_compact >= self.compact_every:
+            self.compact()
+
+    def snapshot(self):
+        # shallow copies are enough since tile dicts are never edited in place (see the note at the top)
+        return dict(self.tilemap.tilemap), self.tilemap.tile_size, list(self.tilemap.offgrid_tiles)
+
+    def compact(self):
+        if self.foreign:
+            return
+        self.since_compact = 0
+        self.queue.put(('compact', (self.snapshot(), self.seq)))
+
+    def save_as(self, path):
+        # full save (like Tilemap.save) without blocking the editor
+        self.queue.put(('save', (self.snapshot(), path)))
+
+    def clear(self):
+        # the work got saved for real, the autosave isn't needed anymore
+        if self.foreign:
+            return
+        self.since_compact = 0
+        self.queue.put(('clear', None))
+
+    def close(self):
+        # waits until everything queued is on disk
+        self.queue.put(('stop', None))
+        self.worker.join()
+
+    def work(self):
+        journal = None
+        while True:
+            task, data = self.queue.get()
+            if task == 'append':
+                if not journal:
+                    journal = open(self.journal_path, 'a')
+                journal.write(json.dumps(data) + '\n')
+                journal.flush()
+            elif task == 'compact':
+                (tilemap, tile_size, offgrid), seq = data
+                write_snapshot(self.snapshot_path, tilemap, tile_size, offgrid, {'source': self.source, 'journal_seq': seq})
+                if journal:
+                    journal.close()
+                journal = open(self.journal_path, 'w') # everything in it is in the snapshot now
+            elif task == 'save':
+                (tilemap, tile_size, offgrid), path = data
+                write_snapshot(path, tilemap, tile_size, offgrid)
+            elif task == 'clear':
+                if journal:
+                    journal.close()
+                    journal = None
+                for path in (self.snapshot_path, self.journal_path):
+                    if os.path.exists(path):
+                        os.remove(path)
+            elif task == 'stop':
+                if journal:
+                    journal.close()
+                return
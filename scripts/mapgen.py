@@ -0,0 +1,220 @@
+import json
+
+from scripts.tilemap import AUTOTILE_TYPES
+from scripts.autotile import AUTOTILE_LUT, NEIGHBOR_BITS
+from scripts.binary_map import MapWriter
+
+# Procedural maps (same format as Tilemap.save, or .nmap) for load testing
+# NOTE every tile is a pure function of (seed, x, y): hills/gaps/platforms come from hashed lattice noise, nothing is random.Random state,
+#      so a strip of columns can be generated (and autotiled, the neighbours are just asked for again) without knowing the rest of the map
+# NOTE maps get written one strip of chunk columns at a time, only that strip is ever in memory
+# Layout (tile coords): columns 0..width-1, ground surface around y=0 (+-hill_height), solid down to y=hill_height+depth,
+#   2 wide walls at both ends, player spawner on the left, boss spawner(s) on the right
+
+MASK = (1 << 64) - 1
+
+# salts for the different noise channels
+HILLS, BUMPS, GAP, GAP_POS, GAP_WIDTH, PLATFORM, PLATFORM_POS, PLATFORM_LEN, PLATFORM_Y, FEATURE, FEATURE_VARIANT = range(11)
+
+GAP_SPACING = 16 # at most one gap per this many columns
+PLATFORM_SPACING = 12 # at most one platform per this many columns
+WALL_HEIGHT = 8
+SAFE_COLUMNS = 12 # no enemies/gaps this close to the player spawner
+DEFAULT_VARIANT = 1 # for the few shapes AUTOTILE_MAP has no rule for (autotile leaves those alone)
+
+
+def noise(seed, salt, value):
+    # hash -> float in [0, 1)
+    h = (seed * 0x9E3779B97F4A7C15 + salt * 0xBF58476D1CE4E5B9 + value * 0x94D049BB133111EB) & MASK
+    h = ((h ^ (h >> 30)) * 0xBF58476D1CE4E5B9) & MASK
+    h = ((h ^ (h >> 27)) * 0x94D049BB133111EB) & MASK
+    return (h ^ (h >> 31)) / 2 ** 64
+
+def smooth_noise(seed, salt, x, width):
+    # value noise in [-1, 1], smoothly interpolated between lattice points every width columns
+    i = x // width
+    t = (x % width) / width
+    t = t * t * (3 - 2 * t)
+    a = noise(seed, salt, i) * 2 - 1
+    b = noise(seed, salt, i + 1) * 2 - 1
+    return a + (b - a) * t
+
+
+class MapGenerator:
+
+    def __init__(self, seed=0, width=200, depth=16, hill_height=6, hill_width=32, grass_depth=2,
+                 gap_chance=0.25, platform_chance=0.35, enemy_density=0.05, tree_density=0.04, decor_density=0.2, bosses=1):
+        self.seed = seed
+        self.width = max(width, SAFE_COLUMNS + 8)
+        self.depth = depth
+        self.hill_height = hill_height
+        self.hill_width = max(1, hill_width)
+        self.grass_depth = grass_depth
+        self.gap_chance = gap_chance
+        self.platform_chance = platform_chance
+        self.enemy_density = enemy_density
+        self.tree_density = tree_density
+        self.decor_density = decor_density
+        self.bosses = bosses
+        self.bottom = hill_height + depth # last solid row
+
+    # --- terrain ---
+
+    def in_gap(self, x):
+        segment = x // GAP_SPACING
+        if noise(self.seed, GAP, segment) >= self.gap_chance:
+            return False
+        start = segment * GAP_SPACING + 4 + int(noise(self.seed, GAP_POS, segment) * 6)
+        end = start + 2 + int(noise(self.seed, GAP_WIDTH, segment) * 3)
+        if start < SAFE_COLUMNS or end > self.width - 4 - 3 * self.bosses: # keep the spawners on solid ground
+            return False
+        return start <= x < end
+
+    def ground(self, x):
+        # y of the top solid tile of column x, ignoring gaps (None outside the map)
+        if x < 0 or x >= self.width:
+            return None
+        height = smooth_noise(self.seed, HILLS, x, self.hill_width) * 0.8 + smooth_noise(self.seed, BUMPS, x, max(1, self.hill_width // 4)) * 0.2
+        y = round(height * self.hill_height)
+        if x < 2 or x >= self.width - 2:
+            y -= WALL_HEIGHT
+        return y
+
+    def surface(self, x):
+        # y of the top solid tile of column x, None = gap (or outside the map)
+        if self.in_gap(x):
+            return None
+        return self.ground(x)
+
+    def platform(self, x):
+        # y of the top row of the platform over column x (platforms are 2 tiles high), None = no platform
+        segment = x // PLATFORM_SPACING
+        if segment == 0 or noise(self.seed, PLATFORM, segment) >= self.platform_chance:
+            return None
+        start = segment * PLATFORM_SPACING + int(noise(self.seed, PLATFORM_POS, segment) * 4)
+        end = start + 3 + int(noise(self.seed, PLATFORM_LEN, segment) * 4)
+        if not (start <= x < end) or end > self.width - 2:
+            return None
+        tops = [self.ground(column) for column in range(start, end)]
+        return min(tops) - 4 - int(noise(self.seed, PLATFORM_Y, segment) * 3)
+
+    def tile_type(self, x, y, columns=None):
+        # the occupancy function: 'grass', 'stone' or None, columns = {x: (surface, platform)} cache
+        surface, platform = columns[x] if columns and x in columns else (self.surface(x), self.platform(x))
+        if platform is not None and platform <= y < platform + 2:
+            return 'grass' if y == platform else 'stone'
+        if surface is None or y < surface or y > self.bottom:
+            return None
+        return 'grass' if y < surface + self.grass_depth else 'stone'
+
+    def autotile_variant(self, x, y, tile_type, columns=None):
+        # same result as Tilemap.autotile, the neighbours come from the occupancy function instead of the tilemap
+        if tile_type not in AUTOTILE_TYPES:
+            return DEFAULT_VARIANT
+        mask = 0
+        for shift, bit in NEIGHBOR_BITS:
+            if self.tile_type(x + shift[0], y + shift[1], columns) == tile_type:
+                mask |= bit
+        variant = AUTOTILE_LUT[mask]
+        return DEFAULT_VARIANT if variant is None else variant
+
+    # --- things standing on the ground ---
+
+    def features(self, x, surface, platform):
+        # decor/trees/spawners for column x (grid tiles, standing on whatever is below them)
+        if surface is None:
+            return []
+        if x == 3:
+            return [{'type': 'spawners', 'variant': 0, 'pos': [x, surface - 1]}]
+        if self.width - 4 - 3 * self.bosses < x <= self.width - 4 and (self.width - 4 - x) % 3 == 0:
+            return [{'type': 'spawners', 'variant': 2, 'pos': [x, surface - 1]}]
+        if x < 2 or x >= self.width - 2:
+            return []
+
+        tiles = []
+        roll = noise(self.seed, FEATURE, x)
+        variant = noise(self.seed, FEATURE_VARIANT, x)
+        if x > SAFE_COLUMNS and roll < self.enemy_density:
+            tiles.append({'type': 'spawners', 'variant': 1, 'pos': [x, surface - 1]})
+        elif roll < self.enemy_density + self.tree_density and self.surface(x + 1) == surface:
+            tiles.append({'type': 'large_decor', 'variant': 2, 'pos': [x, surface - 2]}) # tree (leaf spawner)
+        elif roll < self.enemy_density + self.tree_density + self.decor_density:
+            tiles.append({'type': 'decor', 'variant': int(variant * 4), 'pos': [x, surface - 1]})
+        if platform is not None and x > SAFE_COLUMNS and variant < self.enemy_density * 2:
+            tiles.append({'type': 'spawners', 'variant': 1, 'pos': [x, platform - 1]})
+        return tiles
+
+    # --- generating ---
+
+    def strip(self, x0, x1):
+        # every grid tile of columns x0..x1-1 (autotiled)
+        columns = {x: (self.surface(x), self.platform(x)) for x in range(x0 - 1, x1 + 1)}
+        tiles = []
+        for x in range(x0, x1):
+            surface, platform = columns[x]
+            top = min(y for y in (surface, platform, self.bottom + 1) if y is not None)
+            for y in range(top, self.bottom + 1):
+                tile_type = self.tile_type(x, y, columns)
+                if tile_type:
+                    tiles.append({'type': tile_type, 'variant': self.autotile_variant(x, y, tile_type, columns), 'pos': [x, y]})
+            tiles += self.features(x, surface, platform)
+        return tiles
+
+    def chunks(self, chunk_size=16):
+        # yields (chunk_loc, tiles) one strip of chunk columns at a time
+        for chunk_x in range((self.width + chunk_size - 1) // chunk_size):
+            rows = {}
+            for tile in self.strip(chunk_x * chunk_size, min(self.width, (chunk_x + 1) * chunk_size)):
+                rows.setdefault(tile['pos'][1] // chunk_size, []).append(tile)
+            for chunk_y in sorted(rows):
+                yield (chunk_x, chunk_y), rows[chunk_y]
+
+    def write(self, writer, chunk_size=16):
+        # writer = MapWriter or JsonMapWriter, returns the number of tiles written
+        count = 0
+        for chunk_loc, tiles in self.chunks(chunk_size):
+            writer.add_chunk(chunk_loc, tiles)
+            count += len(tiles)
+        writer.close()
+        return count
+
+    def map_data(self):
+        # the whole map in memory (Tilemap.load format), for small maps
+        tilemap = {}
+        for chunk_loc, tiles in self.chunks():
+            for tile in tiles:
+                tilemap[str(tile['pos'][0]) + ';' + str(tile['pos'][1])] = tile
+        return {'tilemap': tilemap, 'tile_size': 16, 'offgrid': []}
+
+
+class JsonMapWriter:
+    # same interface as MapWriter, but writes the json format (Tilemap.save) tile by tile
+
+    def __init__(self, path, tile_size=16):
+        self.tile_size = tile_size
+        self.offgrid = []
+        self.count = 0
+        self.f = open(path, 'w')
+        self.f.write('{"tilemap": {')
+
+    def add_chunk(self, chunk_loc, tiles):
+        for tile in tiles:
+            self.f.write((', ' if self.count else '') + '"' + str(tile['pos'][0]) + ';' + str(tile['pos'][1]) + '": ' + json.dumps(tile))
+            self.count += 1
+
+    def add_offgrid(self, tile):
+        self.offgrid.append(tile)
+
+    def close(self):
+        self.f.write('}, "tile_size": ' + json.dumps(self.tile_size) + ', "offgrid": ' + json.dumps(self.offgrid) + '}')
+        self.f.close()
+
+
+def generate(path, chunk_size=16, **knobs):
+    # writes a generated map to path (.nmap -> binary format, anything else -> json), returns the generator + tile count
+    generator = MapGenerator(**knobs)
+    if path.endswith('.nmap'):
+        writer = MapWriter(path, tile_size=16, chunk_size=chunk_size)
+    else:
+        writer = JsonMapWriter(path, tile_size=16)
+    return generator, generator.write(writer, chunk_size)
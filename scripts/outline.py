@@ -0,0 +1,42 @@
+import pygame
+
+# Black outline around everything in the "front" layer (same look as the old 4 offset blits of the whole display's silhouette,
+# overlapping offsets still darken each other)
+# Static stuff (tiles) gets its outline baked once with outline_image(), only the moving stuff (entities, bullets, sparks)
+# gets its silhouette rebuilt every frame, into the same surface buffer instead of a new mask + surface
+# NOTE the per-frame silhouette comes from blend fills instead of pygame.mask.from_surface (pygame can't refill an existing Mask
+#      from a surface, it always allocates a new one), which only differs on half transparent pixels (none on the outline layer,
+#      sprites are colorkeyed and sparks are solid polygons)
+
+OUTLINE_COLOR = (0, 0, 0, 180)
+OUTLINE_OFFSETS = [(-1, 0), (1, 0), (0, -1), (0, 1)]
+
+def blit_outline(surf, silhouette, offset=(0, 0)):
+    # the silhouette once per OUTLINE_OFFSETS, like the original outline code
+    for shift in OUTLINE_OFFSETS:
+        surf.blit(silhouette, (offset[0] + shift[0], offset[1] + shift[1]))
+
+def outline_image(img, color=OUTLINE_COLOR):
+    # pre-outlined version of img, 1px bigger on every side (so blit it at pos - (1, 1))
+    silhouette = pygame.mask.from_surface(img).to_surface(setcolor=color, unsetcolor=(0, 0, 0, 0))
+    outline = pygame.Surface((img.get_width() + 2, img.get_height() + 2), pygame.SRCALPHA)
+    blit_outline(outline, silhouette, offset=(1, 1))
+    return outline
+
+
+class OutlineRenderer:
+
+    def __init__(self, size, color=OUTLINE_COLOR):
+        self.color = color
+        self.layer = pygame.Surface(size, pygame.SRCALPHA) # render the moving stuff that needs an outline here
+        self.silhouette = pygame.Surface(size, pygame.SRCALPHA) # reused every frame
+
+    def clear(self):
+        self.layer.fill((0, 0, 0, 0))
+
+    def render(self, surf):
+        # outline of whatever is on self.layer, drawn onto surf
+        self.silhouette.fill((0, 0, 0, self.color[3]))
+        self.silhouette.blit(self.layer, (0, 0), special_flags=pygame.BLEND_RGBA_MIN) # alpha = color alpha where the layer is opaque, 0 where it's empty
+        self.silhouette.fill(self.color[:3] + (0,), special_flags=pygame.BLEND_RGBA_MAX) # rgb = color
+        blit_outline(surf, self.silhouette)
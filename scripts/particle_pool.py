@@ -0,0 +1,177 @@
+import math
+from array import array
+
+import pygame
+
+# Fixed-capacity, array-backed particles and sparks (no object per particle, dead ones get swap-removed)
+# NOTE append() still takes Particle/Spark objects so entity code doing self.game.particles.append(Particle(...)) keeps working
+
+SWAY_TYPES = {'leaf'} # particle types that sway side to side while they fall
+
+class ParticlePool:
+
+    def __init__(self, game, capacity=16384):
+        self.game = game
+        self.capacity = capacity # new particles are dropped once the pool is full
+        self.count = 0
+        self.density = 1.0 # fraction of spawn() calls that actually spawn a particle (lowered by the QualityGovernor)
+        self.spawn_credit = 0.0
+
+        self.types = [] # kind index -> particle type (e.g. 'leaf')
+        self.frames = [] # kind index -> [(img, half_w, half_h)] for every animation frame (already divided by img_duration)
+        self.last_frame = [] # kind index -> last animation frame
+        self.loops = [] # kind index -> does the animation loop
+        self.sways = [] # kind index -> does it sway (leaves)
+
+        self.kind = array('B', bytes(capacity))
+        self.x = array('d', bytes(8 * capacity))
+        self.y = array('d', bytes(8 * capacity))
+        self.vel_x = array('d', bytes(8 * capacity))
+        self.vel_y = array('d', bytes(8 * capacity))
+        self.frame = array('l', bytes(array('l').itemsize * capacity))
+
+    def __len__(self):
+        return self.count
+
+    def kind_index(self, p_type):
+        if p_type not in self.types:
+            # cache the frame table for this type once (same frames as game.assets['particles/' + p_type])
+            animation = self.game.assets['particles/' + p_type]
+            frames = []
+            for img in animation.images:
+                frames += [(img, img.get_width() // 2, img.get_height() // 2)] * animation.img_duration
+            self.types.append(p_type)
+            self.frames.append(frames)
+            self.last_frame.append(len(frames) - 1)
+            self.loops.append(animation.loop)
+            self.sways.append(p_type in SWAY_TYPES)
+        return self.types.index(p_type)
+
+    def spawn(self, p_type, pos, velocity=(0, 0), frame=0):
+        if self.count == self.capacity:
+            return
+        if self.density < 1: # evenly skip spawns (no randomness, particles are only visual but the rng is not)
+            self.spawn_credit += self.density
+            if self.spawn_credit < 1:
+                return
+            self.spawn_credit -= 1
+        i = self.count
+        self.kind[i] = self.kind_index(p_type)
+        self.x[i] = pos[0]
+        self.y[i] = pos[1]
+        self.vel_x[i] = velocity[0]
+        self.vel_y[i] = velocity[1]
+        self.frame[i] = frame
+        self.count += 1
+
+    def append(self, particle):
+        self.spawn(particle.type, particle.pos, particle.velocity, particle.animation.frame)
+
+    def clear(self):
+        self.count = 0
+
+    def kill(self, i):
+        last = self.count - 1
+        self.kind[i] = self.kind[last]
+        self.x[i] = self.x[last]
+        self.y[i] = self.y[last]
+        self.vel_x[i] = self.vel_x[last]
+        self.vel_y[i] = self.vel_y[last]
+        self.frame[i] = self.frame[last]
+        self.count = last
+
+    def update(self):
+        # same as Particle.update for every particle (+ the leaf sway), walking backwards so swap-remove never skips one
+        kind, x, y, vel_x, vel_y, frame = self.kind, self.x, self.y, self.vel_x, self.vel_y, self.frame
+        last_frame, loops, sways = self.last_frame, self.loops, self.sways
+        sin = math.sin
+
+        for i in range(self.count - 1, -1, -1):
+            k = kind[i]
+            if not loops[k] and frame[i] >= last_frame[k]: # animation finished last update
+                self.kill(i)
+                continue
+            x[i] += vel_x[i]
+            y[i] += vel_y[i]
+            if loops[k]:
+                frame[i] = (frame[i] + 1) % (last_frame[k] + 1)
+            else:
+                frame[i] = min(frame[i] + 1, last_frame[k])
+            if sways[k]:
+                x[i] += sin(frame[i] * 0.035) * 0.3
+
+    def render(self, surf, offset=(0, 0)):
+        kind, x, y, frame, frames = self.kind, self.x, self.y, self.frame, self.frames
+        blit_list = []
+        for i in range(self.count):
+            img, half_w, half_h = frames[kind[i]][frame[i]]
+            blit_list.append((img, (x[i] - offset[0] - half_w, y[i] - offset[1] - half_h)))
+        surf.blits(blit_list, doreturn=False)
+
+
+class SparkPool:
+
+    def __init__(self, capacity=4096):
+        self.capacity = capacity # new sparks are dropped once the pool is full
+        self.count = 0
+
+        self.x = array('d', bytes(8 * capacity))
+        self.y = array('d', bytes(8 * capacity))
+        self.angle = array('d', bytes(8 * capacity))
+        self.speed = array('d', bytes(8 * capacity))
+        self.cos = array('d', bytes(8 * capacity)) # cos/sin of the angle, computed once at spawn
+        self.sin = array('d', bytes(8 * capacity))
+
+    def __len__(self):
+        return self.count
+
+    def spawn(self, pos, angle, speed):
+        if self.count == self.capacity:
+            return
+        i = self.count
+        self.x[i] = pos[0]
+        self.y[i] = pos[1]
+        self.angle[i] = angle
+        self.speed[i] = speed
+        self.cos[i] = math.cos(angle)
+        self.sin[i] = math.sin(angle)
+        self.count += 1
+
+    def append(self, spark):
+        self.spawn(spark.pos, spark.angle, spark.speed)
+
+    def clear(self):
+        self.count = 0
+
+    def kill(self, i):
+        last = self.count - 1
+        for column in (self.x, self.y, self.angle, self.speed, self.cos, self.sin):
+            column[i] = column[last]
+        self.count = last
+
+    def update(self):
+        # same as Spark.update: move along the angle and slow down, dies when it stops
+        x, y, speed, cos, sin = self.x, self.y, self.speed, self.cos, self.sin
+        for i in range(self.count - 1, -1, -1):
+            x[i] += cos[i] * speed[i]
+            y[i] += sin[i] * speed[i]
+            speed[i] = max(0, speed[i] - 0.1)
+            if not speed[i]:
+                self.kill(i)
+
+    def render(self, surf, offset=(0, 0)):
+        # diamond shape pointing along the angle (long side = speed * 3, short side = speed * 0.5)
+        x, y, speed, cos, sin = self.x, self.y, self.speed, self.cos, self.sin
+        for i in range(self.count):
+            px = x[i] - offset[0]
+            py = y[i] - offset[1]
+            long_x = cos[i] * speed[i] * 3
+            long_y = sin[i] * speed[i] * 3
+            short_x = -sin[i] * speed[i] * 0.5 # (cos, sin) rotated by 90 degrees
+            short_y = cos[i] * speed[i] * 0.5
+            pygame.draw.polygon(surf, (255, 255, 255), [
+                (px + long_x, py + long_y),
+                (px + short_x, py + short_y),
+                (px - long_x, py - long_y),
+                (px - short_x, py - short_y),
+            ])
@@ -0,0 +1,78 @@
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import pygame
+
+from scripts.tilemap import Tilemap
+from scripts.solid_grid import SolidGrid
+
+# Loads + preprocesses levels on a background thread so load_level only has to swap them in
+# NOTE a prepared Level is never changed while it's being played (spawners are only read, the tilemap is static),
+#      so restarting a level just reuses it (no disk, no json, even the tile cache chunks stay valid)
+
+SPAWNER_IDS = [('spawners', 0), ('spawners', 1), ('spawners', 2)]
+
+class Level:
+
+    def __init__(self, tilemap):
+        # takes the spawners/leaf spawners out of a freshly loaded tilemap (what load_level used to do every time)
+        self.tile_size = tilemap.tile_size
+        self.leaf_spawners = [pygame.Rect(4 + tree['pos'][0], 4 + tree['pos'][1], 23, 13) for tree in tilemap.extract([('large_decor', 2)], keep=True)]
+        self.spawners = tilemap.extract(SPAWNER_IDS)
+        self.tilemap = tilemap.tilemap
+        self.offgrid = tilemap.offgrid_tiles
+        self.solid_grid = None
+
+
+def prepare_level(game, map_path):
+    # everything that doesn't need the game's current state: parse, extract, build the collision grid
+    tilemap = Tilemap(game, tile_size=16)
+    tilemap.load(map_path)
+    level = Level(tilemap)
+    level.solid_grid = SolidGrid(tilemap)
+    return level
+
+
+class LevelPreloader:
+
+    def __init__(self, game, keep=3, map_dir='data/maps'):
+        self.game = game
+        self.keep = keep # how many prepared levels stay cached (the current one + the next one + one spare)
+        self.map_dir = map_dir
+        self.levels = OrderedDict() # map_path -> Future of a Level (oldest first)
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.count = None
+
+    def level_count(self):
+        # number of levels in map_dir (listed once)
+        if self.count is None:
+            self.count = len(os.listdir(self.map_dir))
+        return self.count
+
+    def request(self, map_path):
+        # starts preparing map_path in the background (if it isn't cached/on its way already)
+        if map_path in self.levels:
+            self.levels.move_to_end(map_path)
+            return
+        self.levels[map_path] = self.executor.submit(prepare_level, self.game, map_path)
+        while len(self.levels) > self.keep:
+            self.levels.popitem(last=False)
+
+    def forget(self, map_path):
+        # drops the cached level, the next get() prepares it from scratch
+        self.levels.pop(map_path, None)
+
+    def close(self):
+        # drops everything that hasn't started loading yet, waits for the one that has
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        self.levels.clear()
+
+    def get(self, map_path):
+        # the prepared level, waits for it if it's still loading (raises the loading error, e.g. FileNotFoundError)
+        self.request(map_path)
+        try:
+            return self.levels[map_path].result()
+        except Exception:
+            del self.levels[map_path] # don't cache the failure, the file might show up later
+            raise
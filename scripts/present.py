@@ -0,0 +1,43 @@
+import pygame
+
+# Gets the low res internal surface onto the window
+# NOTE the scaled frame goes straight into the window surface (or into one preallocated buffer when it has to be offset for screenshake),
+#      so presenting never allocates a new window sized surface
+# NOTE dirty rects (in internal pixels) only work when the window is an integer multiple of the internal size,
+#      then every internal pixel is an exact block of window pixels and a rect can be scaled on its own
+
+class Presenter:
+
+    def __init__(self, window_size=(640, 480), internal_size=(320, 240)):
+        self.screen = pygame.display.set_mode(window_size)
+        self.window_size = self.screen.get_size()
+        self.internal_size = internal_size
+        self.scale = (self.window_size[0] / internal_size[0], self.window_size[1] / internal_size[1])
+        self.integer = self.scale[0].is_integer() and self.scale[1].is_integer() # dirty rect fast path possible
+        self.buffer = pygame.Surface(self.window_size) # only for offset (screenshake) frames
+
+    def to_internal(self, pos):
+        # window pos (e.g. the mouse) -> internal surface pos
+        return (pos[0] / self.scale[0], pos[1] / self.scale[1])
+
+    def present(self, surf, offset=(0, 0), dirty=None):
+        # dirty = list of rects (internal pixels) that changed since the last frame, None = everything
+        if offset[0] or offset[1]:
+            pygame.transform.scale(surf, self.window_size, self.buffer)
+            self.screen.blit(self.buffer, offset)
+            pygame.display.update()
+        elif dirty is not None and self.integer:
+            sx, sy = int(self.scale[0]), int(self.scale[1])
+            surf_r = surf.get_rect()
+            updated = []
+            for rect in dirty:
+                rect = surf_r.clip(rect)
+                if rect.width and rect.height:
+                    window_r = pygame.Rect(rect.x * sx, rect.y * sy, rect.width * sx, rect.height * sy)
+                    pygame.transform.scale(surf.subsurface(rect), window_r.size, self.screen.subsurface(window_r))
+                    updated.append(window_r)
+            if updated:
+                pygame.display.update(updated)
+        else:
+            pygame.transform.scale(surf, self.window_size, self.screen)
+            pygame.display.update()
@@ -0,0 +1,103 @@
+import csv
+import json
+from collections import deque
+from time import perf_counter_ns
+
+import pygame
+
+# Per-phase frame timer: wrap each phase of the frame in start(name)/stop(name), call end_frame() once per frame
+# Keeps a rolling window for the on-screen overlay (p50/p99 per phase) and, if trace_len is set, a longer trace that can be dumped to csv/json
+# NOTE a trace row is ~1KB, only keep one when something is going to be dumped (trace_len=0 -> no trace, dump() only has the summary)
+
+class FrameProfiler:
+
+    def __init__(self, window=300, trace_len=0):
+        self.window = window # frames used for the rolling p50/p99
+        self.phases = [] # phase names in the order they first showed up (= order in the frame)
+        self.history = {} # phase -> deque of the last `window` timings (ns)
+        self.counts = {} # phase -> number of things handled in that phase this frame (e.g. enemies)
+        self.frame = {} # phase -> ns spent this frame (a phase can be started/stopped more than once per frame)
+        self.starts = {}
+        self.trace = deque(maxlen=trace_len) if trace_len else None # one row per frame: {'frame': n, phase: ns, phase + '_count': n, ...}
+        self.frame_count = 0
+
+        self.font = None
+        self.overlay = None # cached overlay surface, text is only re-rendered every few frames
+        self.overlay_refresh = 15
+
+    def start(self, name):
+        self.starts[name] = perf_counter_ns()
+
+    def stop(self, name):
+        elapsed = perf_counter_ns() - self.starts[name]
+        if name not in self.history:
+            self.phases.append(name)
+            self.history[name] = deque(maxlen=self.window)
+        self.frame[name] = self.frame.get(name, 0) + elapsed
+
+    def count(self, name, amount):
+        self.counts[name] = amount
+
+    def end_frame(self):
+        # only phases that ran this frame get a sample (steps without rendering must not pull the render phases' p50/p99 down)
+        for name in self.frame:
+            self.history[name].append(self.frame[name])
+        if self.trace is not None:
+            row = {'frame': self.frame_count}
+            row.update(self.frame)
+            for name in self.counts:
+                row[name + '_count'] = self.counts[name]
+            self.trace.append(row)
+        self.frame = {}
+        self.frame_count += 1
+
+    def percentile(self, name, p):
+        timings = sorted(self.history[name])
+        if not timings:
+            return 0
+        return timings[min(len(timings) - 1, int(len(timings) * p / 100))]
+
+    def summary(self):
+        # phase -> {'p50': ms, 'p99': ms, 'mean': ms} over the rolling window
+        summary = {}
+        for name in self.phases:
+            timings = self.history[name]
+            summary[name] = {
+                'p50': self.percentile(name, 50) / 1e6,
+                'p99': self.percentile(name, 99) / 1e6,
+                'mean': (sum(timings) / len(timings) / 1e6) if timings else 0,
+            }
+        return summary
+
+    def render(self, surf, pos=(4, 4), extra=None):
+        # extra = function returning more lines for the bottom of the overlay (only called when the overlay gets re-rendered)
+        if (self.overlay is None) or (self.frame_count % self.overlay_refresh == 0):
+            if not self.font:
+                pygame.font.init()
+                self.font = pygame.font.Font(None, 12)
+            lines = ['phase        p50ms  p99ms']
+            for name, stats in self.summary().items():
+                line = name.ljust(12) + ' ' + ('%.2f' % stats['p50']).rjust(5) + '  ' + ('%.2f' % stats['p99']).rjust(5)
+                if name in self.counts:
+                    line += '  x' + str(self.counts[name])
+                lines.append(line)
+            if extra:
+                lines += extra()
+            line_height = self.font.get_linesize()
+            self.overlay = pygame.Surface((max(self.font.size(line)[0] for line in lines) + 4, line_height * len(lines) + 4), pygame.SRCALPHA)
+            self.overlay.fill((0, 0, 0, 160))
+            for i, line in enumerate(lines):
+                self.overlay.blit(self.font.render(line, False, (255, 255, 255)), (2, 2 + i * line_height))
+        surf.blit(self.overlay, pos)
+
+    def dump(self, path):
+        # .csv -> one row per frame (phases that didn't run that frame are left empty), anything else -> json with the trace and the p50/p99 summary
+        columns = ['frame'] + self.phases + [name + '_count' for name in self.counts]
+        if path.endswith('.csv'):
+            with open(path, 'w', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=columns, restval='')
+                writer.writeheader()
+                writer.writerows(self.trace or [])
+        else:
+            with open(path, 'w') as f:
+                json.dump({'summary': self.summary(), 'trace': list(self.trace or [])}, f)
@@ -0,0 +1,99 @@
+from array import array
+
+# Struct-of-arrays bullet storage: one preallocated column per field instead of one list per bullet
+# Dead bullets are swap-removed (last bullet moves into the hole) so removing is O(1) instead of list.remove's O(n)
+# NOTE legacy projectile format (still accepted by append()): projectile = [[x, y], direction, timer, dmg]
+
+MAX_TIMER = 360 # bullets disappear after 6 seconds
+
+class ProjectilePool:
+
+    def __init__(self, capacity=256):
+        self.capacity = capacity
+        self.count = 0 # bullets [0, count) are alive
+        self.x = array('d', bytes(8 * capacity))
+        self.y = array('d', bytes(8 * capacity))
+        self.direction = array('d', bytes(8 * capacity))
+        self.timer = array('l', bytes(array('l').itemsize * capacity))
+        self.dmg = array('d', bytes(8 * capacity))
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        # returns a copy in the legacy format (entities use self.game.projectiles[-1][0] right after shooting)
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError('projectile index out of range')
+        return [[self.x[i], self.y[i]], self.direction[i], self.timer[i], self.dmg[i]]
+
+    def grow(self):
+        # double the size of every column (only happens when the pool is full)
+        for column in (self.x, self.y, self.direction, self.timer, self.dmg):
+            column.extend(column)
+        self.capacity *= 2
+
+    def spawn(self, pos, direction, dmg=0, timer=0):
+        if self.count == self.capacity:
+            self.grow()
+        i = self.count
+        self.x[i] = pos[0]
+        self.y[i] = pos[1]
+        self.direction[i] = direction
+        self.timer[i] = timer
+        self.dmg[i] = dmg
+        self.count += 1
+
+    def append(self, projectile):
+        # so code that does self.game.projectiles.append([[x, y], direction, timer, dmg]) keeps working
+        self.spawn(projectile[0], projectile[1], projectile[3] if len(projectile) > 3 else 0, projectile[2])
+
+    def clear(self):
+        self.count = 0
+
+    def kill(self, i):
+        # swap-remove: move the last bullet into slot i
+        last = self.count - 1
+        self.x[i] = self.x[last]
+        self.y[i] = self.y[last]
+        self.direction[i] = self.direction[last]
+        self.timer[i] = self.timer[last]
+        self.dmg[i] = self.dmg[last]
+        self.count = last
+
+    def update(self, solid_grid, player_rect, player_vulnerable=True):
+        # moves every bullet and kills the ones that hit a wall, ran out of time or hit the player
+        # returns (wall_hits, player_hits): wall_hits = [((x, y), direction)], player_hits = [((x, y), dmg)]
+        x, y, direction, timer = self.x, self.y, self.direction, self.timer
+        count = self.count
+
+        # pass 1: advance everything
+        for i in range(count):
+            x[i] += direction[i]
+            timer[i] += 1
+
+        # pass 2: wall check for the whole batch at once
+        hit_walls = solid_grid.solid_check_many(zip(x[:count], y[:count]))
+
+        # pass 3: expire/hit test, walking backwards so swap-remove never skips a bullet
+        wall_hits = []
+        player_hits = []
+        for i in range(count - 1, -1, -1):
+            if hit_walls[i]:
+                wall_hits.append(((x[i], y[i]), direction[i]))
+                self.kill(i)
+            elif timer[i] > MAX_TIMER:
+                self.kill(i)
+            elif player_vulnerable and player_rect.collidepoint(x[i], y[i]):
+                player_hits.append(((x[i], y[i]), self.dmg[i]))
+                self.kill(i)
+
+        return wall_hits, player_hits
+
+    def render(self, surf, img, offset=(0, 0)):
+        # all bullets share one img so they go out in a single blits() call
+        half_w = img.get_width() / 2 + offset[0]
+        half_h = img.get_height() / 2 + offset[1]
+        x, y = self.x, self.y
+        surf.blits([(img, (x[i] - half_w, y[i] - half_h)) for i in range(self.count)], doreturn=False)
@@ -0,0 +1,47 @@
+# Batches blits per target surface: everything submitted to a layer goes out in one Surface.blits() call on flush()
+# NOTE a RenderLayer can be passed to any render(surf, offset) method that only blits (entities, clouds, tile cache, pools),
+#      everything else (get_width, get_size, ...) goes straight to the real surface
+# NOTE stuff that draws directly (pygame.draw, outline masks) has to happen after the layer it should cover got flushed
+
+class RenderLayer:
+
+    def __init__(self, surf):
+        self.surf = surf
+        self.queue = []
+
+    def blit(self, source, dest, area=None, special_flags=0):
+        if area is None and not special_flags:
+            self.queue.append((source, dest))
+        else:
+            self.queue.append((source, dest, area, special_flags))
+
+    def blits(self, blit_sequence, doreturn=True):
+        self.queue.extend(blit_sequence)
+
+    def flush(self):
+        if self.queue:
+            self.surf.blits(self.queue, doreturn=False)
+            self.queue = []
+
+    def __getattr__(self, name):
+        return getattr(self.surf, name)
+
+
+class RenderQueue:
+
+    def __init__(self):
+        self.layers = [] # flushed in the order they were added
+
+    def layer(self, surf):
+        layer = RenderLayer(surf)
+        self.layers.append(layer)
+        return layer
+
+    def flush(self):
+        for layer in self.layers:
+            layer.flush()
+
+    def clear(self):
+        # drops everything that was submitted (e.g. a frame that won't be shown)
+        for layer in self.layers:
+            layer.queue = []
@@ -0,0 +1,223 @@
+import copy
+import zlib
+import random
+import struct
+
+import pygame
+
+# Input recording + deterministic playback
+# NOTE a replay is the seed + level it started on + one byte per frame (zlib compressed, so usually way less than a byte):
+#   bit 0/1/2 -> left/right/down held at the end of the frame
+#   bit 3-4   -> how many times jump was pressed that frame (0-3)
+#   bit 5     -> dash was pressed that frame
+# NOTE only the end-of-frame held state matters (Game.update runs before the input of a frame gets handled), so that's all that gets stored
+
+MAGIC = b'NRPL'
+VERSION = 1
+HEADER = struct.Struct('<4sHqIBH') # magic, version, seed, frame count, testing, level length (level string follows)
+
+HELD = {'left': 1, 'right': 2, 'down': 4}
+JUMP_SHIFT = 3
+DASH = 32
+
+# action -> key, replays always get played with the arrow key controls
+ACTION_KEYS = {'left': pygame.K_LEFT, 'right': pygame.K_RIGHT, 'down': pygame.K_DOWN, 'jump': pygame.K_UP, 'dash': pygame.K_x}
+
+
+def write_replay(path, seed, level, testing, frames):
+    level = str(level).encode('utf-8')
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, seed, len(frames), int(testing), len(level)))
+        f.write(level)
+        f.write(zlib.compress(bytes(frames), 9))
+
+def read_replay(path):
+    # returns seed, level, testing, frames
+    with open(path, 'rb') as f:
+        data = f.read()
+    magic, version, seed, frame_count, testing, level_len = HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError(path + ' is not a replay file')
+    if version != VERSION:
+        raise ValueError(path + ' has unsupported replay version ' + str(version))
+    level = data[HEADER.size:HEADER.size + level_len].decode('utf-8')
+    frames = zlib.decompress(data[HEADER.size + level_len:])
+    if len(frames) != frame_count:
+        raise ValueError(path + ' is truncated')
+    return seed, (level if testing else int(level)), bool(testing), frames
+
+def frame_events(byte, prev_byte):
+    # the pygame events that turn the held state of the last frame into this one (+ the presses of this frame)
+    events = []
+    for action, bit in HELD.items():
+        if (byte & bit) and not (prev_byte & bit):
+            events.append(pygame.event.Event(pygame.KEYDOWN, key=ACTION_KEYS[action]))
+        elif (prev_byte & bit) and not (byte & bit):
+            events.append(pygame.event.Event(pygame.KEYUP, key=ACTION_KEYS[action]))
+    for i in range((byte >> JUMP_SHIFT) & 3):
+        events.append(pygame.event.Event(pygame.KEYDOWN, key=ACTION_KEYS['jump']))
+    if byte & DASH:
+        events.append(pygame.event.Event(pygame.KEYDOWN, key=ACTION_KEYS['dash']))
+    return events
+
+
+class Recorder:
+    # restarts the current level with a known seed, then records every frame until save()
+
+    def __init__(self, game, path, seed=None):
+        self.game = game
+        self.path = path
+        self.seed = random.randrange(2 ** 31) if seed is None else seed
+        self.testing = game.testing
+        self.level = game.level
+        self.frames = bytearray()
+        self.held = 0
+        self.jumps = 0
+        self.dash = False
+
+        self.game.new_run(self.level, seed=self.seed, testing=self.testing)
+        self.game.recorder = self
+
+    def press(self, action):
+        if action in HELD:
+            self.held |= HELD[action]
+        elif action == 'jump':
+            self.jumps = min(3, self.jumps + 1)
+        elif action == 'dash':
+            self.dash = True
+
+    def release(self, action):
+        if action in HELD:
+            self.held &= ~HELD[action]
+
+    def end_frame(self):
+        self.frames.append(self.held | (self.jumps << JUMP_SHIFT) | (DASH if self.dash else 0))
+        self.jumps = 0
+        self.dash = False
+
+    def save(self):
+        write_replay(self.path, self.seed, self.level, self.testing, self.frames)
+
+
+class Replayer:
+    # feeds a replay back into a game, can seek by restoring the snapshots it took on the way (every snapshot_every frames)
+
+    # the game attributes that make up the simulation state (the tilemap never changes while playing, so it's not in here)
+    STATE = ['player', 'enemies', 'healthbars', 'projectiles', 'particles', 'sparks', 'clouds', 'leaf_spawners',
+             'scroll', 'screenshake', 'dead_timer', 'transition', 'movement', 'use_wasd', 'level', 'map_name', 'testing']
+
+    def __init__(self, game, path, snapshot_every=600):
+        self.game = game
+        self.seed, self.level, self.testing, self.frames = read_replay(path)
+        self.snapshot_every = snapshot_every
+        self.snapshots = {} # frame -> snapshot
+        self.shared = self.shared_objects()
+
+        self.restart()
+        self.game.replayer = self
+
+    def restart(self):
+        self.game.new_run(self.level, seed=self.seed, testing=self.testing)
+        self.game.use_wasd = False # replays use the arrow key actions
+        self.frame = 0
+
+    def done(self):
+        return self.frame >= len(self.frames)
+
+    def next_events(self):
+        # events for the next frame (nothing once the replay ran out)
+        if self.frame % self.snapshot_every == 0 and self.frame not in self.snapshots:
+            self.snapshots[self.frame] = self.snapshot()
+        if self.done():
+            return []
+        events = frame_events(self.frames[self.frame], self.frames[self.frame - 1] if self.frame else 0)
+        self.frame += 1
+        return events
+
+    def frame_input(self, events):
+        # the real events only get to quit/toggle the overlay (any other key, released ones too, would desync the game), + the next replay frame
+        kept = [event for event in events if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_F3)]
+        return kept + self.next_events()
+
+    def fast_forward(self, frames):
+        # no rendering and no clock, as fast as the simulation goes
+        for i in range(frames):
+            self.game.step(self.next_events(), render=False)
+
+    def seek(self, frame):
+        # jumps to the closest snapshot before frame (if that saves any work), then fast forwards the rest
+        frame = max(0, min(frame, len(self.frames)))
+        if frame < self.frame:
+            taken = [snapshot_frame for snapshot_frame in self.snapshots if snapshot_frame <= frame]
+        else:
+            taken = [snapshot_frame for snapshot_frame in self.snapshots if self.frame < snapshot_frame <= frame]
+        if taken:
+            self.restore(max(taken))
+        elif frame < self.frame:
+            self.restart()
+        self.fast_forward(frame - self.frame)
+
+    def shared_objects(self):
+        # memo for deepcopy: things that are not state (the game, assets, sounds, ...) stay the same object
+        game = self.game
+        shared = [game, game.tilemap, game.sfx, game.assets]
+        for sound in game.sfx.values():
+            shared.append(sound)
+        for asset in game.assets.values():
+            if isinstance(asset, pygame.Surface):
+                shared.append(asset)
+            elif isinstance(asset, list):
+                shared += [asset] + asset
+            else: # Animation
+                shared += [asset, asset.images] + asset.images
+        return {id(obj): obj for obj in shared}
+
+    def snapshot(self):
+        game = self.game
+        state = {name: getattr(game, name) for name in self.STATE}
+        state['active'] = [game.enemies.index(enemy) for enemy in game.activity.active]
+        state['rng'] = (game.rng.getstate(), game.render_rng.getstate(), random.getstate())
+        state['replay_frame'] = self.frame
+        return copy.deepcopy(state, dict(self.shared))
+
+    def state(self):
+        # what check_replay compares: where everything is + the rng states
+        game = self.game
+        return (game.player.pos, game.player.velocity, game.player.hp, [(enemy.pos, enemy.hp) for enemy in game.enemies],
+                [game.projectiles[i] for i in range(len(game.projectiles))], list(game.scroll), game.dead_timer, game.movement,
+                game.player.gravity_vel_change, game.rng.getstate())
+
+    def restore(self, frame):
+        game = self.game
+        state = copy.deepcopy(self.snapshots[frame], dict(self.shared)) # copy again so the snapshot can be restored more than once
+        for name in self.STATE:
+            setattr(game, name, state[name])
+        game.rng.setstate(state['rng'][0])
+        game.render_rng.setstate(state['rng'][1])
+        random.setstate(state['rng'][2])
+
+        # these are keyed by id(), rebuild them for the new objects
+        game.entity_healthbars = {id(healthbar.entity): healthbar for healthbar in game.healthbars}
+        game.activity.reset(game.enemies)
+        game.activity.active = [game.enemies[i] for i in state['active']]
+        self.frame = state['replay_frame']
+
+
+def check_replay(game, path):
+    # plays path twice: as is, then with a viewer mashing the keyboard (every key pressed + released now and then),
+    # the keyboard must not change anything -> returns True if both runs end in the same state
+    keys = list(ACTION_KEYS.values()) + [pygame.K_a, pygame.K_d, pygame.K_s, pygame.K_c]
+    end_states = []
+    for noisy in (False, True):
+        replayer = Replayer(game, path)
+        frame = 0
+        while not replayer.done():
+            events = []
+            if noisy and frame % 7 == 0:
+                key = keys[frame % len(keys)]
+                events = [pygame.event.Event(pygame.KEYUP, key=key), pygame.event.Event(pygame.KEYDOWN, key=key)]
+            game.step(replayer.frame_input(events), render=False)
+            frame += 1
+        end_states.append(copy.deepcopy(replayer.state()))
+    game.replayer = None
+    return end_states[0] == end_states[1]
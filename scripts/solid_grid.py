@@ -0,0 +1,90 @@
+from scripts.tilemap import PHYSICS_TILES
+
+# Flat occupancy grid of the physics tiles in a Tilemap (1 byte per tile, indexed by ints instead of "x;y" strings)
+# NOTE the grid only covers the bounding box of the solid tiles, everything outside of it is air
+# NOTE tiles added later (streamed map chunks) go in with add_tiles(), the grid only grows (with some margin) when they don't fit
+
+GROW_MARGIN = 32 # extra tiles on each side that grew, so the next few streamed chunks fit without copying the grid again
+
+class SolidGrid:
+
+    def __init__(self, tilemap):
+        self.tilemap = tilemap
+        self.build()
+
+    def build(self):
+        # call this whenever the tilemap gets (re)loaded
+        self.tile_size = self.tilemap.tile_size
+
+        solid_locs = [tile['pos'] for tile in self.tilemap.tilemap.values() if tile['type'] in PHYSICS_TILES]
+        if not solid_locs:
+            self.min_x, self.min_y, self.width, self.height = 0, 0, 0, 0
+            self.grid = bytearray()
+            return
+
+        self.min_x = min(loc[0] for loc in solid_locs)
+        self.min_y = min(loc[1] for loc in solid_locs)
+        self.width = max(loc[0] for loc in solid_locs) - self.min_x + 1
+        self.height = max(loc[1] for loc in solid_locs) - self.min_y + 1
+        self.grid = bytearray(self.width * self.height)
+        for loc in solid_locs:
+            self.grid[(loc[1] - self.min_y) * self.width + (loc[0] - self.min_x)] = 1
+
+    def contains(self, min_x, min_y, max_x, max_y):
+        return self.min_x <= min_x and self.min_y <= min_y and max_x < self.min_x + self.width and max_y < self.min_y + self.height
+
+    def grow(self, min_x, min_y, max_x, max_y):
+        # makes the grid cover these tile bounds too, keeps everything that's already in it
+        if self.width:
+            new_min_x = min(self.min_x, min_x - GROW_MARGIN) if min_x < self.min_x else self.min_x
+            new_min_y = min(self.min_y, min_y - GROW_MARGIN) if min_y < self.min_y else self.min_y
+            new_max_x = max_x + GROW_MARGIN if max_x >= self.min_x + self.width else self.min_x + self.width - 1
+            new_max_y = max_y + GROW_MARGIN if max_y >= self.min_y + self.height else self.min_y + self.height - 1
+        else:
+            new_min_x, new_min_y, new_max_x, new_max_y = min_x, min_y, max_x, max_y
+        width = new_max_x - new_min_x + 1
+        height = new_max_y - new_min_y + 1
+        grid = bytearray(width * height)
+        shift_x = self.min_x - new_min_x
+        for row in range(self.height):
+            start = (row + self.min_y - new_min_y) * width + shift_x
+            grid[start:start + self.width] = self.grid[row * self.width:(row + 1) * self.width]
+        self.min_x, self.min_y, self.width, self.height, self.grid = new_min_x, new_min_y, width, height, grid
+
+    def set_solid(self, tile_pos, solid=True):
+        # for tiles placed/removed after build(), the grid grows if a solid tile lands outside of it
+        x = int(tile_pos[0])
+        y = int(tile_pos[1])
+        if solid and not self.contains(x, y, x, y):
+            self.grow(x, y, x, y)
+        if self.contains(x, y, x, y):
+            self.grid[(y - self.min_y) * self.width + (x - self.min_x)] = 1 if solid else 0
+
+    def add_tiles(self, tiles):
+        # tiles that just got added to the tilemap (e.g. a streamed in chunk), grows the grid at most once
+        solid_locs = [tile['pos'] for tile in tiles if tile['type'] in PHYSICS_TILES]
+        if not solid_locs:
+            return
+        bounds = (min(loc[0] for loc in solid_locs), min(loc[1] for loc in solid_locs), max(loc[0] for loc in solid_locs), max(loc[1] for loc in solid_locs))
+        if not self.contains(*bounds):
+            self.grow(*bounds)
+        for loc in solid_locs:
+            self.grid[(loc[1] - self.min_y) * self.width + (loc[0] - self.min_x)] = 1
+
+    def solid_check(self, pos):
+        x = int(pos[0] // self.tile_size) - self.min_x
+        y = int(pos[1] // self.tile_size) - self.min_y
+        if 0 <= x < self.width and 0 <= y < self.height:
+            return self.grid[y * self.width + x] == 1
+        return False
+
+    def solid_check_many(self, points):
+        # same as solid_check but for a whole batch of points (e.g. every bullet) in one call, returns a list of bools
+        grid, width, height, tile_size = self.grid, self.width, self.height, self.tile_size
+        min_x, min_y = self.min_x, self.min_y
+        results = []
+        for pos in points:
+            x = int(pos[0] // tile_size) - min_x
+            y = int(pos[1] // tile_size) - min_y
+            results.append(0 <= x < width and 0 <= y < height and grid[y * width + x] == 1)
+        return results
@@ -0,0 +1,94 @@
+import pygame
+
+# Uniform grid spatial hash: every item is stored in each cell its rect overlaps, so point/rect queries only look at a few cells
+# NOTE items are tracked by id() so unhashable things (like the offgrid tile dicts) work too
+# NOTE items keep their insertion order inside a cell (the tile cache relies on that for layering),
+#      insert(..., key=...) puts an item in front of the first item in each cell with a bigger key instead of at the end
+
+class SpatialHash:
+
+    def __init__(self, cell_size=64):
+        self.cell_size = cell_size
+        self.cells = {} # (cell_x, cell_y) -> [items]
+        self.rects = {} # id(item) -> (item, rect)
+
+    def __len__(self):
+        return len(self.rects)
+
+    def __contains__(self, item):
+        return id(item) in self.rects
+
+    def cell_range(self, rect):
+        # every cell the rect overlaps (a 0 size rect still counts as the cell its corner is in)
+        cell_size = self.cell_size
+        for cell_x in range(int(rect.left // cell_size), int((max(rect.right, rect.left + 1) - 1) // cell_size) + 1):
+            for cell_y in range(int(rect.top // cell_size), int((max(rect.bottom, rect.top + 1) - 1) // cell_size) + 1):
+                yield (cell_x, cell_y)
+
+    def insert(self, item, rect, key=None):
+        if id(item) in self.rects:
+            self.remove(item)
+        rect = pygame.Rect(rect)
+        self.rects[id(item)] = (item, rect)
+        for cell in self.cell_range(rect):
+            cell_items = self.cells.setdefault(cell, [])
+            if key is None:
+                cell_items.append(item)
+            else:
+                item_key = key(item)
+                i = len(cell_items)
+                while i and key(cell_items[i - 1]) > item_key:
+                    i -= 1
+                cell_items.insert(i, item)
+
+    def remove(self, item):
+        # returns the rect the item had (None if it wasn't in here)
+        entry = self.rects.pop(id(item), None)
+        if not entry:
+            return None
+        for cell in self.cell_range(entry[1]):
+            cell_items = self.cells[cell]
+            for i, other in enumerate(cell_items):
+                if other is item:
+                    del cell_items[i]
+                    break
+            if not cell_items:
+                del self.cells[cell]
+        return entry[1]
+
+    def move(self, item, rect):
+        # only touches the cells if the item actually changed cells
+        entry = self.rects.get(id(item))
+        rect = pygame.Rect(rect)
+        if entry and list(self.cell_range(entry[1])) == list(self.cell_range(rect)):
+            self.rects[id(item)] = (item, rect)
+        else:
+            self.insert(item, rect)
+
+    def rect(self, item):
+        return self.rects[id(item)][1]
+
+    def cell_items(self, cell):
+        return self.cells.get(cell, [])
+
+    def query_rect(self, rect):
+        # items whose rect overlaps rect (each item once)
+        rect = pygame.Rect(rect)
+        found = []
+        seen = set()
+        for cell in self.cell_range(rect):
+            for item in self.cells.get(cell, []):
+                if id(item) not in seen:
+                    seen.add(id(item))
+                    if self.rects[id(item)][1].colliderect(rect):
+                        found.append(item)
+        return found
+
+    def query_point(self, pos):
+        # items whose rect contains pos
+        cell = (int(pos[0] // self.cell_size), int(pos[1] // self.cell_size))
+        return [item for item in self.cells.get(cell, []) if self.rects[id(item)][1].collidepoint(pos)]
+
+    def clear(self):
+        self.cells = {}
+        self.rects = {}
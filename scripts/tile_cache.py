@@ -0,0 +1,160 @@
+import pygame
+
+from scripts.outline import outline_image
+from scripts.spatial import SpatialHash
+
+# Pre-bakes the (static) tiles of a Tilemap into chunk surfaces so rendering is a few big blits instead of one blit per tile
+# NOTE chunk_loc = (chunk_x, chunk_y), a chunk covers chunk_size x chunk_size tiles
+
+class TileChunkCache:
+
+    def __init__(self, tilemap, chunk_size=16, outline=False):
+        self.tilemap = tilemap
+        self.chunk_size = chunk_size # in tiles
+        self.outline = outline # also bake an outline for every chunk (see render_outline)
+
+        self.chunks = {} # chunk_loc -> baked surface (None if the chunk is empty)
+        self.outlines = {} # chunk_loc -> baked outline of the chunk (1px bigger on every side)
+        self.dirty = set() # chunk_locs that need to be rebaked before the next render
+        self.offgrid_index = None # SpatialHash of the offgrid tiles with chunk sized cells, so a cell == a chunk_loc (built lazily)
+        self.grid_margin = None # how many tiles a grid tile's img can stick out past its own tile (e.g. large_decor on grid)
+        self.rebaked = False # True if the last render() had to (re)bake or drop a chunk, i.e. the picture can differ from the frame before
+
+    def chunk_px(self):
+        return self.chunk_size * self.tilemap.tile_size
+
+    def invalidate(self):
+        # whole map changed (e.g. load() or autotile()), throw everything away
+        self.chunks = {}
+        self.outlines = {}
+        self.dirty = set()
+        self.offgrid_index = None
+        self.grid_margin = None
+
+    def mark_dirty(self, tile_pos):
+        # grid tile at tile_pos was placed/changed/deleted
+        if self.grid_margin is None:
+            self.update_grid_margin()
+        tile_loc = str(tile_pos[0]) + ';' + str(tile_pos[1])
+        if tile_loc in self.tilemap.tilemap:
+            self.grid_margin = max(self.grid_margin, self.tile_margin(self.tilemap.tilemap[tile_loc]))
+        for x in range(int(tile_pos[0]), int(tile_pos[0]) + self.grid_margin + 1):
+            for y in range(int(tile_pos[1]), int(tile_pos[1]) + self.grid_margin + 1):
+                self.dirty.add((x // self.chunk_size, y // self.chunk_size))
+
+    def mark_dirty_rect(self, rect):
+        # something in this pixel rect changed (e.g. new grid tiles were streamed in), offgrid tiles go through add_offgrid/remove_offgrid
+        chunk_px = self.chunk_px()
+        for chunk_x in range(int(rect.left // chunk_px), int((rect.right - 1) // chunk_px) + 1):
+            for chunk_y in range(int(rect.top // chunk_px), int((rect.bottom - 1) // chunk_px) + 1):
+                self.dirty.add((chunk_x, chunk_y))
+
+    def add_offgrid(self, tile, index=None):
+        # tile was just put into tilemap.offgrid_tiles (at index, None = appended)
+        # NOTE chunks draw their offgrid tiles in index order, a tile that went back in the middle (undo) has to go in the same spot here
+        if self.offgrid_index is not None:
+            offgrid_tiles = self.tilemap.offgrid_tiles
+            if index is None or offgrid_tiles[-1] is tile:
+                self.offgrid_index.insert(tile, self.offgrid_rect(tile))
+            else:
+                order = {id(other): i for i, other in enumerate(offgrid_tiles)}
+                self.offgrid_index.insert(tile, self.offgrid_rect(tile), key=lambda other: order.get(id(other), -1))
+        self.mark_dirty_rect(self.offgrid_rect(tile))
+
+    def remove_offgrid(self, tile):
+        # tile was just removed from tilemap.offgrid_tiles
+        if self.offgrid_index is not None:
+            self.offgrid_index.remove(tile)
+        self.mark_dirty_rect(self.offgrid_rect(tile))
+
+    def offgrid_at(self, pos):
+        # offgrid tiles under a (world pixel) pos
+        if self.offgrid_index is None:
+            self.index_offgrid()
+        return self.offgrid_index.query_point(pos)
+
+    def offgrid_in(self, rect):
+        # offgrid tiles overlapping a (world pixel) rect
+        if self.offgrid_index is None:
+            self.index_offgrid()
+        return self.offgrid_index.query_rect(rect)
+
+    def offgrid_rect(self, tile):
+        img = self.tilemap.game.assets[tile['type']][tile['variant']]
+        return pygame.Rect(tile['pos'][0], tile['pos'][1], img.get_width(), img.get_height())
+
+    def tile_margin(self, tile):
+        img = self.tilemap.game.assets[tile['type']][tile['variant']]
+        return max(0, (max(img.get_width(), img.get_height()) - 1) // self.tilemap.tile_size)
+
+    def update_grid_margin(self):
+        self.grid_margin = 0
+        for tile in self.tilemap.tilemap.values():
+            self.grid_margin = max(self.grid_margin, self.tile_margin(tile))
+
+    def index_offgrid(self):
+        # offgrid tiles can be bigger than a tile (large_decor) so they go in every chunk they overlap
+        self.offgrid_index = SpatialHash(self.chunk_px())
+        for tile in self.tilemap.offgrid_tiles:
+            self.offgrid_index.insert(tile, self.offgrid_rect(tile))
+
+    def build_chunk(self, chunk_loc):
+        tile_size = self.tilemap.tile_size
+        chunk_px = self.chunk_px()
+        origin = (chunk_loc[0] * chunk_px, chunk_loc[1] * chunk_px)
+
+        if self.offgrid_index is None:
+            self.index_offgrid()
+        if self.grid_margin is None:
+            self.update_grid_margin()
+
+        chunk_surf = pygame.Surface((chunk_px, chunk_px), pygame.SRCALPHA)
+        empty = True
+
+        # same layering as Tilemap.render: offgrid tiles first, then grid tiles on top
+        for tile in self.offgrid_index.cell_items(chunk_loc):
+            chunk_surf.blit(self.tilemap.game.assets[tile['type']][tile['variant']], (tile['pos'][0] - origin[0], tile['pos'][1] - origin[1]))
+            empty = False
+
+        # start a few tiles early so big grid tiles from the neighbouring chunks still poke into this one
+        for x in range(chunk_loc[0] * self.chunk_size - self.grid_margin, (chunk_loc[0] + 1) * self.chunk_size):
+            for y in range(chunk_loc[1] * self.chunk_size - self.grid_margin, (chunk_loc[1] + 1) * self.chunk_size):
+                loc = str(x) + ';' + str(y)
+                if loc in self.tilemap.tilemap:
+                    tile = self.tilemap.tilemap[loc]
+                    chunk_surf.blit(self.tilemap.game.assets[tile['type']][tile['variant']], (tile['pos'][0] * tile_size - origin[0], tile['pos'][1] * tile_size - origin[1]))
+                    empty = False
+
+        self.chunks[chunk_loc] = None if empty else chunk_surf
+        if self.outline and not empty:
+            self.outlines[chunk_loc] = outline_image(chunk_surf)
+
+    def visible_chunks(self, surf, offset=(0, 0)):
+        chunk_px = self.chunk_px()
+        for chunk_x in range(int(offset[0] // chunk_px), int((offset[0] + surf.get_width()) // chunk_px) + 1):
+            for chunk_y in range(int(offset[1] // chunk_px), int((offset[1] + surf.get_height()) // chunk_px) + 1):
+                yield (chunk_x, chunk_y)
+
+    def render(self, surf, offset=(0, 0)):
+        # drop the stale chunks, they get rebaked lazily below (only if they are on screen)
+        self.rebaked = bool(self.dirty)
+        for chunk_loc in self.dirty:
+            self.chunks.pop(chunk_loc, None)
+            self.outlines.pop(chunk_loc, None)
+        self.dirty.clear()
+
+        chunk_px = self.chunk_px()
+        for chunk_loc in self.visible_chunks(surf, offset):
+            if chunk_loc not in self.chunks:
+                self.build_chunk(chunk_loc)
+                self.rebaked = True
+            chunk_surf = self.chunks[chunk_loc]
+            if chunk_surf is not None:
+                surf.blit(chunk_surf, (chunk_loc[0] * chunk_px - offset[0], chunk_loc[1] * chunk_px - offset[1]))
+
+    def render_outline(self, surf, offset=(0, 0)):
+        # baked outlines of the visible chunks (call after render() so they are up to date)
+        chunk_px = self.chunk_px()
+        for chunk_loc in self.visible_chunks(surf, offset):
+            if chunk_loc in self.outlines:
+                surf.blit(self.outlines[chunk_loc], (chunk_loc[0] * chunk_px - offset[0] - 1, chunk_loc[1] * chunk_px - offset[1] - 1))